@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from libs.classification_methods import Jenks, Ckmeans
+
+from argparse import ArgumentParser
+from time import time
+from numpy import random, asarray, sort, searchsorted, bincount
+
+
+def goodness_of_variance_fit(data, breaks):
+    """Returns 1 - (sum of squared deviations from class means)/(sum of squared deviations from mean).
+    """
+
+    data = sort(asarray(data))
+    classes = searchsorted(breaks[1:-1], data, side='left')
+    counts = bincount(classes)
+    means = bincount(classes, data)/counts.clip(1)
+    return 1 - ((data-means[classes])**2).sum()/((data-data.mean())**2).sum()
+
+
+parser = ArgumentParser()
+parser.add_argument('-k', '--classes', type=int, default=6, help='number of classes')
+parser.add_argument('-n', type=int, nargs='+', default=[10**2, 10**3, 10**4, 10**5, 10**6], help='numbers of values')
+parser.add_argument('-r', '--reference', type=int, default=2000, help='largest n for the Jenks implementation (it is extrapolated above)')
+parser.add_argument('-s', '--sample', type=int, default=10**4, help='sample size of the sampling mode')
+args = parser.parse_args()
+
+r = random.RandomState(0)
+jenks = None
+for n in args.n:
+    data = r.lognormal(8, 1, n).tolist()
+
+    start = time()
+    breaks = Ckmeans().classify(data, args.classes)
+    ckmeans = time()-start
+    line = 'n=%d: ckmeans %.3f s' % (n, ckmeans)
+
+    start = time()
+    sampled = Ckmeans(args.sample).classify(data, args.classes)
+    line += ', sampled %.3f s (goodness of variance fit %.5f, optimal %.5f)' % (time()-start,
+            goodness_of_variance_fit(data, sampled), goodness_of_variance_fit(data, breaks))
+
+    if n <= args.reference:
+        start = time()
+        same = Jenks().classify(data, args.classes) == breaks
+        jenks = (time()-start, n)
+        line += ', jenks %.3f s (same breaks: %s)' % (jenks[0], same)
+    elif jenks is not None:
+        line += ', jenks %.0f s extrapolated' % (jenks[0]*(n/float(jenks[1]))**2)
+    print line
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from libs.elo_rating_system import calculate_difficulties, _elo
+from libs.common import defaultdict_factory, first_questions
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from time import time
+from numpy import random, arange, cumsum, where, uint32, uint16, uint8, float16, int64
+from pandas import DataFrame
+
+
+def generate_answers(n, number_of_users, number_of_places=200, seed=0):
+    """Generates n random answers sorted by user and time (as after add_session_numbers).
+    """
+
+    r = random.RandomState(seed)
+    users = r.randint(0, number_of_users, n).astype(uint32)
+    asked = r.randint(0, number_of_places, n).astype(uint16)
+    answered = where(r.rand(n) < 0.7, asked, r.randint(0, number_of_places, n)).astype(float16)
+    frame = DataFrame({'user': users, 'place_asked': asked, 'place_answered': answered,
+                       'number_of_options': r.choice([0, 2, 4, 6], n).astype(uint8),
+                       'inserted': (1388534400*10**9+cumsum(r.randint(1, 600, n)).astype(int64)*10**9).view('datetime64[ns]')},
+                      index=arange(n))
+    return frame.sort(['user', 'inserted'])
+
+
+def calculate_difficulties_iterrows(frame):
+    """Previous implementation of calculate_difficulties, kept for comparison.
+    """
+
+    first = first_questions(frame.groupby('user'))
+    difficulties = defaultdict(defaultdict_factory)
+    prior_skill  = defaultdict(defaultdict_factory)
+
+    for index, answer in first.iterrows():
+        update = _elo(answer,
+                    prior_skill[answer.user][0], prior_skill[answer.user][1],
+                    difficulties[answer.place_asked][0], difficulties[answer.place_asked][1])
+
+        prior_skill[answer.user] = (update[0], prior_skill[answer.user][1]+1)
+        difficulties[answer.place_asked] = (update[1], difficulties[answer.place_asked][1]+1)
+
+    return (difficulties, prior_skill)
+
+
+parser = ArgumentParser()
+parser.add_argument('-n', type=int, default=10**7, help='number of answers for the array engine')
+parser.add_argument('-r', '--reference', type=int, default=10**5, help='number of answers for the iterrows implementation (it is extrapolated to n)')
+parser.add_argument('-u', '--users', type=int, default=None, help='number of users -- default is n/100')
+args = parser.parse_args()
+
+frame = generate_answers(args.n, args.users or max(args.n//100, 1))
+start = time()
+calculate_difficulties(frame)
+engine = time()-start
+print 'array engine, %d answers: %.2f s' % (args.n, engine)
+
+sample = frame[frame.user < frame.user.max()*args.reference/float(args.n)]
+start = time()
+reference = calculate_difficulties_iterrows(sample)
+iterrows = time()-start
+print 'iterrows, %d answers: %.2f s (%.2f s extrapolated to %d)' % (len(sample), iterrows, iterrows*args.n/float(len(sample)), args.n)
+print 'same result on the sample:', reference == calculate_difficulties(sample)
+print 'speedup: %.0fx' % (iterrows*args.n/float(len(sample))/engine)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from libs.elo_rating_system import calculate_difficulties, estimate_prior_knowledge_batch, estimate_current_knowledge_batch
+from libs.parallel import estimate_prior_knowledge_parallel, estimate_current_knowledge_parallel
+from libs.common import add_session_numbers_by_user, session_first_questions
+
+from argparse import ArgumentParser
+from multiprocessing import cpu_count
+from time import time
+from numpy import random, arange, cumsum, where, uint32, uint16, uint8, float16, int64
+from pandas import DataFrame
+
+
+def generate_answers(n, number_of_users, number_of_places=200, seed=0):
+    """Generates n random answers of users spread over several sessions.
+    """
+
+    r = random.RandomState(seed)
+    asked = r.randint(0, number_of_places, n).astype(uint16)
+    return DataFrame({'user': r.randint(0, number_of_users, n).astype(uint32), 'place_asked': asked,
+                      'place_answered': where(r.rand(n) < 0.7, asked, r.randint(0, number_of_places, n)).astype(float16),
+                      'number_of_options': r.choice([0, 2, 4, 6], n).astype(uint8),
+                      'inserted': (1388534400*10**9+cumsum(r.randint(1, 600, n)).astype(int64)*10**9).view('datetime64[ns]')},
+                     index=arange(n))
+
+
+def timed(func):
+    start = time()
+    func()
+    return time()-start
+
+
+parser = ArgumentParser()
+parser.add_argument('-n', type=int, default=10**6, help='number of answers')
+parser.add_argument('-u', '--users', type=int, default=None, help='number of users -- default is n/100')
+parser.add_argument('-p', '--processes', type=int, nargs='+', default=None, help='numbers of processes -- default is 1, 2, 4, ... up to number of cpus')
+args = parser.parse_args()
+
+frame = session_first_questions(add_session_numbers_by_user(generate_answers(args.n, args.users or max(args.n//100, 1))))
+difficulties = calculate_difficulties(frame)[0]
+processes = args.processes or [2**i for i in range(cpu_count().bit_length()) if 2**i <= cpu_count()]
+
+benchmarks = [('prior knowledge', lambda: estimate_prior_knowledge_batch(frame, difficulties),
+               lambda p: estimate_prior_knowledge_parallel(frame, difficulties, processes=p)),
+              ('current knowledge', lambda: estimate_current_knowledge_batch(frame, difficulties),
+               lambda p: estimate_current_knowledge_parallel(frame, difficulties, p))]
+print '%d first questions of %d users' % (len(frame), frame.user.nunique())
+for name, serial, parallel in benchmarks:
+    base = timed(serial)
+    print '%s, serially: %.2f s' % (name, base)
+    for p in processes:
+        elapsed = timed(lambda: parallel(p))
+        print '%s, %d processes: %.2f s (speedup %.2fx, efficiency %.0f%%)' % (name, p, elapsed, base/elapsed, 100*base/elapsed/p)
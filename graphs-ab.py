@@ -2,7 +2,7 @@
 
 from libs.graph import Graph 
 from libs.input_output import get_arguments, load_ab_csv
-from libs.elo_rating_system import estimate_prior_knowledge
+from libs.elo_rating_system import estimate_prior_knowledge_batch, PriorTable
 
 from os import path,makedirs
 
@@ -31,14 +31,12 @@ ab = load_ab_csv(working_directory+'/data/geography.answer.ab_testing.csv')
 
 a = Graph(working_directory, ab[0], codes=codes)
 
-ab_prior = a.frame.groupby('user')
-ab_prior = ab_prior.apply(lambda x: estimate_prior_knowledge(x, prior[0]))
-a.set_prior((prior[0], ab_prior.to_dict()))
+ab_prior = estimate_prior_knowledge_batch(a.frame, prior[0])
+a.set_prior((prior[0], PriorTable(ab_prior.index.values, ab_prior.skill.values, ab_prior['count'].values)))
 
 b = Graph(working_directory, ab[1], codes=codes)
-ab_prior = b.frame.groupby('user')
-ab_prior = ab_prior.apply(lambda x: estimate_prior_knowledge(x, prior[0]))
-b.set_prior((prior[0], ab_prior.to_dict()))
+ab_prior = estimate_prior_knowledge_batch(b.frame, prior[0])
+b.set_prior((prior[0], PriorTable(ab_prior.index.values, ab_prior.skill.values, ab_prior['count'].values)))
 
 directory = working_directory+'/graphs/ab/'
 if not path.exists(directory):
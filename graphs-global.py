@@ -1,14 +1,26 @@
 # -*- coding: utf-8 -*-
 
 from libs.graph import Graph 
-from libs.input_output import get_arguments
+from libs.input_output import get_arguments, update_activity_cube, dataset_fingerprint
+from libs.answer_store import AnswerStore
+from libs import streaming
 
 from os import path,makedirs
+from multiprocessing import cpu_count
 
 
 (items, frame, prior, codes, working_directory) = get_arguments(path.dirname(path.realpath(__file__)), False)
 
-g = Graph(working_directory, frame, prior = prior, codes=codes)
+stream = isinstance(frame, AnswerStore)
+if stream:
+    g = Graph(working_directory, frame.empty(), prior = prior, codes=codes)
+    results = streaming.run(frame.iter_chunks(), {'sessions': streaming.sessions(), 'activity': streaming.activity()})
+    g.set_sessions(results['sessions'])
+    g.set_activity(results['activity'])
+else:
+    g = Graph(working_directory, frame, prior = prior, codes=codes)
+    g.set_processes(cpu_count())
+    g.set_activity(update_activity_cube(frame, working_directory+'/data', dataset_fingerprint(working_directory+'/data/geography.answer.csv')))
 
 directory = working_directory+'/graphs/global/'
 if not path.exists(directory):
@@ -17,18 +29,21 @@ if not path.exists(directory):
 print 'Generating global graphs'
 g.difficulty_histogram(directory=directory)
 g.prior_skill_histogram(directory=directory)
-g.difficulty_response_time(directory=directory)
 g.lengths_of_sessions(directory=directory)
 g.number_of_answers_per_session(directory=directory)
-g.number_of_answers_over_time(directory=directory)
 g.number_of_users_per_session(directory=directory)
-g.number_of_users_over_time(directory=directory)
 g.response_time_start_end(directory=directory)
-
 g.weekday_activity(directory=directory)
 g.hourly_activity(directory=directory)
-g.separated_success(directory=directory)
-g.average_success(directory=directory)
-g.separated_skill(directory=directory)
-g.average_skill(directory=directory)
-g.success_over_time(directory=directory)
+if stream:
+    print 'Skipping graphs which need all answers in memory (over time, by difficulty, success and skill per session)'
+else:
+    g.difficulty_response_time(directory=directory)
+    g.number_of_answers_over_time(directory=directory)
+    g.number_of_users_over_time(directory=directory)
+    g.response_time_start_end_samples(directory=directory)
+    g.separated_success(directory=directory)
+    g.average_success(directory=directory)
+    g.separated_skill(directory=directory)
+    g.average_skill(directory=directory)
+    g.success_over_time(directory=directory)
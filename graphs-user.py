@@ -6,7 +6,7 @@ from libs.input_output import get_arguments
 from os import path,makedirs
 
 
-(items, frame, prior, codes, working_directory) = get_arguments(path.dirname(path.realpath(__file__)), True)
+(items, frame, prior, codes, working_directory) = get_arguments(path.dirname(path.realpath(__file__)), True, use_store=True)
 
 for item in items:
     g = Graph(working_directory, frame, users=[int(item)], prior = prior, codes=codes)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+from elo_rating_system import answer_ids
+from numpy import zeros, bincount, concatenate, arange, int64
+from pandas import DatetimeIndex, Series
+
+"""Activity cube -- numbers of answers and correct answers bucketed by day x hour. Weekday and hourly activity are
+answered from it exactly. Cube is updated incrementally by answers newer than its high-water mark.
+"""
+
+
+DAY = 24*3600*10**9 #nanoseconds
+
+
+class ActivityCube():
+    def __init__(self, first_day=0, counts=None, correct=None, last_id=-1):
+        """Answers bucketed by day x hour. Use build_activity_cube or update to fill it.
+
+        :param first_day: first day of the cube (days since 1970-01-01)
+        :param counts: numbers of answers, array of shape (days, 24)
+        :param correct: numbers of correct answers, array of shape (days, 24)
+        :param last_id: id of the newest answer in the cube (-1 for empty cube)
+        """
+
+        self.first_day = first_day
+        self.counts = zeros((0, 24), dtype=int64) if counts is None else counts
+        self.correct = zeros((0, 24), dtype=int64) if correct is None else correct
+        self.last_id = last_id
+
+
+    def _extend(self, first_day, last_day):
+        """Extends day axis to hold days from first_day to last_day.
+        """
+
+        if len(self.counts):
+            first_day, last_day = min(first_day, self.first_day), max(last_day, self.first_day+len(self.counts)-1)
+        before = self.first_day-first_day if len(self.counts) else 0
+        after = last_day-first_day+1-before-len(self.counts)
+        pad = lambda values: concatenate([zeros((before,)+values.shape[1:], values.dtype), values,
+                                          zeros((after,)+values.shape[1:], values.dtype)])
+        self.counts, self.correct = pad(self.counts), pad(self.correct)
+        self.first_day = first_day
+
+
+    def update(self, frame):
+        """Adds answers newer than the high-water mark (by id).
+
+        :returns: number of added answers
+        """
+
+        ids = answer_ids(frame)
+        new = ids > self.last_id
+        if not new.any():
+            return 0
+        inserted = frame.inserted.values.view(int64)[new]
+        days = inserted//DAY
+        self._extend(int(days.min()), int(days.max()))
+
+        cells = (days-self.first_day)*24 + (inserted//(3600*10**9))%24
+        size = self.counts.size
+        self.counts += bincount(cells, minlength=size).reshape(self.counts.shape)
+        correct = (frame.place_asked.values == frame.place_answered.values)[new]
+        self.correct += bincount(cells[correct], minlength=size).reshape(self.correct.shape)
+
+        self.last_id = int(ids[new].max())
+        return int(new.sum())
+
+
+    def add(self, other, fill_value=0):
+        """Returns cube of answers of both cubes (same signature as DataFrame.add, so cubes can be streaming aggregates).
+        Cubes have to hold different answers, e.g. answers of different users.
+        """
+
+        result = ActivityCube(self.first_day, self.counts.copy(), self.correct.copy(), max(self.last_id, other.last_id))
+        if len(other.counts):
+            result._extend(other.first_day, other.first_day+len(other.counts)-1)
+            rows = slice(other.first_day-result.first_day, other.first_day-result.first_day+len(other.counts))
+            result.counts[rows] += other.counts
+            result.correct[rows] += other.correct
+        return result
+
+
+    def is_prefix_of(self, frame):
+        """Returns whether frame only appends answers to the cube -- its answers up to the high-water mark give
+        the same numbers of answers and of correct answers in every day and hour as the cube.
+        """
+
+        old = answer_ids(frame) <= self.last_id
+        cells = frame.inserted.values.view(int64)[old]
+        cells = (cells//DAY-self.first_day)*24 + (cells//(3600*10**9))%24
+        if len(cells) and (cells.min() < 0 or cells.max() >= self.counts.size):
+            return False
+        correct = (frame.place_asked.values == frame.place_answered.values)[old]
+        return ((bincount(cells, minlength=self.counts.size) == self.counts.reshape(-1)).all() and
+                (bincount(cells[correct], minlength=self.counts.size) == self.correct.reshape(-1)).all())
+
+
+    def days(self):
+        """Returns DatetimeIndex of days of the cube.
+        """
+
+        return DatetimeIndex(((self.first_day+arange(len(self.counts)))*DAY).view('datetime64[ns]'))
+
+
+    def weekday_activity(self):
+        """Returns counts of answers per weekdays (first value is Monday etc), same as analysis_per_time.weekday_activity.
+        """
+
+        weekdays = (self.first_day+arange(len(self.counts))+3)%7 #1970-01-01 was Thursday
+        return Series(bincount(weekdays, self.counts.sum(axis=1), minlength=7).astype(int64))
+
+
+    def hourly_activity(self):
+        """Returns counts of answers per hour, same as analysis_per_time.hourly_activity.
+        """
+
+        return Series(self.counts.sum(axis=0))
+
+
+def build_activity_cube(frame):
+    """Returns ActivityCube of all answers of frame.
+    """
+
+    cube = ActivityCube()
+    cube.update(frame)
+    return cube
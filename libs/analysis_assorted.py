@@ -1,60 +1,94 @@
 # -*- coding: utf-8 -*-
 
-from common import add_item_numbers, first_questions, logis
+from common import item_numbers, first_question_mask, session_first_questions, logis
 from pandas import DataFrame, Series, concat
 from analysis_per_place import response_time, mistaken_places
-from elo_rating_system import estimate_current_knowledge
+from elo_rating_system import estimate_current_knowledge_batch, difficulty_array, group_codes
+from numpy import exp, float64, lexsort
+from memo import memoized
 
 
-def response_time_over_items(frame, threshold=60000):
+def _over_items(data, values, by=[]):
+    """Returns number and mean of values for every item number (within groups of by) in one grouped aggregation.
+    """
+
+    numbers = data.item_number.values if 'item_number' in data else item_numbers(data, by+['user'])
+    data = Series(values).groupby([data[column].values for column in by]+[numbers])
+    data = concat([data.size(), data.mean()], axis=1)
+    data.columns = ['counts','result']
+    data.index.names = by+['item_number']
+    return data
+
+
+def response_time_over_items(frame, threshold=60000, by=[]):
     '''Returns mean response_time over answers for specific country.
     
     :param threshold: upper threshold for response times
+    :param by: columns to evaluate separately (e.g. ['place_asked']) -- default is [] (all answers together)
     '''
     data = frame[frame.response_time<threshold]
-    data = first_questions(data.groupby(['user','session_number']))
-    data = data.groupby('user')
-    data = data.apply(add_item_numbers)
-    data = data.groupby('item_number')
-    data = concat([data.apply(lambda x: x.item_number.count()),data.apply(lambda x: x.response_time.mean())],axis=1)
-    data.columns = ['counts','result']
-    return data
+    data = data[first_question_mask(data)]
+    if 'item_number' in data:
+        del data['item_number'] #items are counted among fast answers
+    return _over_items(data, data.response_time.values.astype(float64), by)
 
 
-def success_over_items(frame):
+def success_over_items(frame, by=[]):
     '''Returns mean success rate over answers for specific country.
+
+    :param by: columns to evaluate separately (e.g. ['place_asked']) -- default is [] (all answers together)
     '''
-    data = first_questions(frame.groupby(['user','session_number']))
-    data = data.groupby('user')
-    data = data.apply(add_item_numbers)
-    data = data.groupby('item_number')
-    data = concat([data.apply(lambda x: x.item_number.count()),data.apply(lambda x: len(x[x.place_asked==x.place_answered])/float(len(x)))],axis=1)
-    data.columns = ['counts','result']
-    return data
+    data = session_first_questions(frame)
+    return _over_items(data, (data.place_asked.values == data.place_answered.values).astype(float64), by)
 
 
-def current_knowledge_over_items(frame, difficulties):
-    data = frame.groupby('user')
-    data = data.apply(add_item_numbers)
-    data = data.groupby('item_number')
-    data = data.apply(lambda x: DataFrame.from_dict(estimate_current_knowledge(x, difficulties),orient='index'))[0]
-    data = data.reset_index()
-    data = data.apply(lambda x: logis(x[0] - difficulties[x["level_1"]][0]),axis=1)
-    data.name = 'result'
-    data.index.name = 'item_number'
-    return data.reset_index()
+def current_knowledge_over_items(frame, difficulties, by=[]):
+    """Returns predicted probability of success over answers -- every item number is replayed as one group
+    (see elo_rating_system.estimate_current_knowledge_batch), item_number column holds item number of the group.
+
+    :param by: columns to evaluate separately (e.g. ['place_asked']) -- default is [] (all answers together)
+    """
+
+    data = frame.copy()
+    if 'item_number' not in data:
+        data['item_number'] = item_numbers(data, by+['user'])
+    groups, first = group_codes(data, by+['item_number'])
+    data['group'] = groups
+    result = estimate_current_knowledge_batch(data, difficulties, 'group').to_frame()
+    keys = DataFrame(dict((column, data[column].values[first]) for column in by+['item_number']), columns=by+['item_number'])
+    result = keys.take(result.group.values).reset_index(drop=True).join(result[['place','skill']])
+    result['result'] = 1.0/(1+exp(-(result.skill.values - difficulty_array(difficulties, result.place.values.astype(float64)))))
+    return result[by+['item_number','result']]
 
 
+def items(frame):
+    """Returns first questions ordered by session and user (sessions of all users in turn, as average_over_items
+    replays them) with item_number -- order of answer among answers of the same user to the same place.
+    """
+
+    data = session_first_questions(frame)
+    data = data.take(lexsort((data.user.values, data.session_number.values)))
+    data['item_number'] = item_numbers(data, ['user','place_asked'])
+    return data
+
+
+@memoized()
 def average_over_items(frame, func):
-    data = first_questions(frame.groupby(['session_number','user']))
-    data = data.groupby('place_asked')
-    data = data.apply(func)
-    data = data.reset_index()[['item_number','result']].groupby('item_number')
-    data = concat([data.apply(len), data.apply(lambda x: x['result'].mean())],axis=1)
+    """Returns func over items of every place averaged by item number.
+
+    :param frame: answers or their items (see items function)
+    :param func: function (frame, by=columns) -> result per item_number within groups of by, e.g. success_over_items
+    """
+
+    data = frame if 'item_number' in frame else items(frame)
+    data = func(data, by=['place_asked'])
+    data = data.reset_index()[['item_number','result']].groupby('item_number')['result']
+    data = concat([data.size(), data.mean()],axis=1)
     data.columns = ['counts','result']
     return data
 
 
+@memoized()
 def answer_portions(frame, threshold=None):
     """Returns portions of answers for specific country.
     
@@ -70,14 +104,15 @@ def answer_portions(frame, threshold=None):
         return (mistaken[mistaken>=threshold]*100).append(Series({0:mistaken[mistaken<threshold].sum()*100}))
 
 
+@memoized()
 def difficulty_response_time(frame, difficulty):
     '''Returns mean response time for correct/incorrect answers for countries with different difficulties
     '''
-    data = first_questions(frame.groupby(['user','session_number']))
+    data = session_first_questions(frame)
     data = DataFrame(response_time(data,right=True))
     data.columns = ['correct']
     data['incorrect'] = response_time(frame,right=False)
-    d = Series(difficulty)
+    d = Series(dict(difficulty))
     d = d.map(lambda x: logis(-x[0]))
     d.name = 'difficulty'
     data = data.join(d)    
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 
-from elo_rating_system import estimate_current_knowledge
-from common import logis, first_questions
+from elo_rating_system import estimate_current_knowledge_batch, difficulty_array
+from parallel import estimate_current_knowledge_parallel
+from quantiles import response_time_sketch
+from common import logis, session_first_questions, session_first_question_mask
 from pandas import Series, DataFrame
+from numpy import int64, float64, exp, bincount, flatnonzero
+from memo import memoized
 
 
 def prior_knowledge(difficulties):
@@ -13,59 +17,132 @@ def prior_knowledge(difficulties):
     return Series(result,index=difficulties.keys())
 
 
-def average_current_knowledge(frame,difficulties):
+@memoized('processes', 'matrix')
+def average_current_knowledge(frame,difficulties,processes=None,matrix=None):
     """Predicted probabilities of success.
+
+    :param processes: estimate skills of users in this many processes (see parallel module) -- default is None (serially)
+    :param matrix: precomputed skills of users of frame (see input_output.get_knowledge_matrix) -- default is None (estimate them)
     """
 
-    skills = first_questions(frame.groupby(['session_number','user']))
-    skills = skills.groupby('user').apply(lambda x: DataFrame.from_dict(estimate_current_knowledge(x,difficulties),orient='index'))
-    skills = skills.reset_index()
-    skills = skills.groupby('level_1').apply(lambda x: x[0].mean())
-    skills = skills.reset_index()
-    index = skills['level_1']
-    skills = Series(skills.apply(lambda x: logis(x[0] - difficulties[x["level_1"]][0]),axis=1))
-    skills.index = index
+    if matrix is not None:
+        skills = matrix
+    elif processes is not None:
+        skills = estimate_current_knowledge_parallel(session_first_questions(frame), difficulties, processes)
+    else:
+        skills = estimate_current_knowledge_batch(session_first_questions(frame), difficulties)
+    skills = skills.place_means()
+    skills = Series(1.0/(1+exp(-(skills.values - difficulty_array(difficulties, skills.index.values.astype(float64))))), index=skills.index)
+    skills.index.name = 'level_1'
     return skills.dropna()
 
 
-def number_of_answers(frame,right=None):
+@memoized()
+def place_metrics(frame, threshold=60000):
+    """Returns table of metrics of every place in one pass over answers. Index is place_asked, columns are numbers
+    of answers, correct and wrong answers, sums and counts of response times under threshold of correct and of wrong
+    answers and (if frame has sessions) numbers of first questions and of correct first questions.
+    Tables of chunks are merged by addition (first questions need whole history of users in chunk).
+
+    :param threshold: upper threshold for response times
+    """
+
+    places = frame.place_asked.values.astype(int64)
+    size = int(places.max())+1 if len(places) else 0
+    correct = frame.place_asked.values == frame.place_answered.values
+    fast = frame.response_time.values < threshold
+    times = frame.response_time.values.astype(float64)
+    count = lambda mask, weights=None: bincount(places[mask], None if weights is None else weights[mask], minlength=size)
+
+    columns = [('answers', bincount(places, minlength=size)),
+               ('correct', count(correct)),
+               ('wrong', count(~correct)),
+               ('response_time_correct', count(fast & correct, times)),
+               ('response_time_correct_count', count(fast & correct)),
+               ('response_time_wrong', count(fast & ~correct, times)),
+               ('response_time_wrong_count', count(fast & ~correct))]
+    if 'session_number' in frame or 'first_question' in frame:
+        first = session_first_question_mask(frame)
+        columns += [('first_questions', count(first)), ('first_correct', count(first & correct))]
+    ids = flatnonzero(columns[0][1])
+    result = DataFrame(dict((name, values[ids]) for name, values in columns), index=ids, columns=[name for name, _ in columns])
+    result.index.name = 'place_asked'
+    return result
+
+
+def _positive(values):
+    return values[values > 0]
+
+
+def number_of_answers_from_partial(partial):
+    return partial.astype(int64).order(ascending=False, kind='mergesort')
+
+
+@memoized()
+def number_of_answers(frame,right=None,metrics=None):
     """Returns numbers of answers per country.
 
     :param right: filter only right/wrong/both answers
     :type right: True/False/None -- default is None
+    :param metrics: place_metrics of frame -- default is None (computed from frame)
     """
 
-    answers = frame
-    if right:
-        answers = frame[frame.place_asked==frame.place_answered]
-    elif right==False:
-        answers = frame[frame.place_asked!=frame.place_answered]
-    return answers['place_asked'].value_counts()
+    if metrics is None:
+        metrics = place_metrics(frame)
+    column = 'answers' if right is None else ('correct' if right else 'wrong')
+    result = number_of_answers_from_partial(_positive(metrics[column]))
+    result.name = result.index.name = None
+    return result
+
 
+def response_time_from_partial(partial):
+    result = partial['sum']/partial['count']
+    result.name = 'response_time'
+    return result
 
-def response_time(frame, right=None, threshold=60000):
+
+@memoized()
+def response_time(frame, right=None, threshold=60000, metrics=None):
     """Returns dataframe of mean response times per country.
 
     :param right: filter only right/wrong/both answers
     :type right: True/False/None -- default is None
+    :param metrics: place_metrics of frame with the same threshold -- default is None (computed from frame)
     """
 
-    answers = frame[frame.response_time<threshold]
-    if right:
-        answers = answers[answers.place_asked==answers.place_answered]
-    elif right == False:
-        answers = answers[answers.place_asked!=answers.place_answered]
-    answers = answers.groupby('place_asked')
-    return answers['response_time'].mean()
+    if metrics is None:
+        metrics = place_metrics(frame, threshold)
+    sums = 0
+    counts = 0
+    for kind in (['correct','wrong'] if right is None else (['correct'] if right else ['wrong'])):
+        sums = sums + metrics['response_time_'+kind]
+        counts = counts + metrics['response_time_'+kind+'_count']
+    return response_time_from_partial(DataFrame({'sum': sums[counts > 0], 'count': counts[counts > 0]}))
+
+
+@memoized()
+def response_time_quantile(frame, q=0.5, right=None, sketch=None):
+    """Returns q-quantile of response times per country (without threshold), estimated by quantile sketches.
 
+    :param q: quantile -- default is 0.5 (median)
+    :param right: filter only right/wrong/both answers
+    :type right: True/False/None -- default is None
+    :param sketch: QuantileSketch of frame -- default is None (computed from frame)
+    """
 
+    if sketch is None:
+        sketch = response_time_sketch(frame)
+    return sketch.quantile(q, right)
+
+
+@memoized()
 def mistaken_places(frame, threshold=None):
     """Returns counts of countries that are most mistaken for this country.
 
     :param threshold: only return top counts -- default is None (which means return all)
     """
 
-    wrong_answers = first_questions(frame.groupby(['user','session_number']))
+    wrong_answers = session_first_questions(frame)
     first_len = len(wrong_answers)
     wrong_answers = wrong_answers[wrong_answers.place_asked!=wrong_answers.place_answered]
     wrong_answers = wrong_answers['place_answered'].value_counts()
@@ -74,11 +151,18 @@ def mistaken_places(frame, threshold=None):
     return (wrong_answers, first_len)
 
 
-def success(frame):
+def success_from_partial(partial):
+    result = partial['correct']/partial['count'].astype(float64)
+    return result.dropna()
+
+
+@memoized()
+def success(frame, metrics=None):
     """Returns mean success rate for each country.
+
+    :param metrics: place_metrics of frame -- default is None (computed from frame)
     """
 
-    groups = first_questions(frame.groupby(['user','session_number']))
-    groups = groups.groupby('place_asked')
-    groups = groups.apply(lambda x: len(x[x.place_asked==x.place_answered])/float(len(x)))
-    return groups.dropna()
\ No newline at end of file
+    if metrics is None:
+        metrics = place_metrics(frame)
+    return success_from_partial(DataFrame({'correct': metrics['first_correct'], 'count': metrics['first_questions']}))
@@ -1,44 +1,138 @@
 # -*- coding: utf-8 -*-
 
-from common import first_questions, get_session_length, add_place_type, add_session_numbers
-from pandas import Series, concat, unique
-from elo_rating_system import estimate_prior_knowledge
+from common import first_questions, session_first_questions, first_question_mask, session_first_question_mask, add_session_numbers, add_session_numbers_by, PlaceLookup
+from pandas import DataFrame, MultiIndex, Series, concat, factorize
+from numpy import lexsort, flatnonzero, concatenate, bincount, minimum, arange, diff, argsort, nan, int64, float64
+from elo_rating_system import estimate_prior_knowledge_batch, pair_keys
+from parallel import estimate_prior_knowledge_parallel
+from memo import memoized
 
 
-def lengths_of_sessions(frame,threshold=None):
-    """Returns length of each session.
+def _sessions(frame):
+    """Returns order of answers sorted by (user, session_number), user and session_number of every session,
+    position of first answer of every session in the order and session of every answer in the order.
     """
 
-    groups = frame.groupby('user')
-    if len(groups)==1:
-        groups = get_session_length(frame)
-    else:
-        groups = groups.apply(get_session_length)
+    order = lexsort((frame.session_number.values, frame.user.values)) #stable -- answers of session stay in order of frame
+    users = frame.user.values[order]
+    sessions = frame.session_number.values[order]
+    starts = flatnonzero(concatenate([[True], (users[1:] != users[:-1]) | (sessions[1:] != sessions[:-1])])[:len(users)])
+    groups = arange(len(starts)).repeat(diff(concatenate([starts, [len(users)]])))
+    return (order, users[starts], sessions[starts], starts, groups)
 
-    groups = groups.reset_index().groupby('session_number')
-    if threshold is None:
-        groups = concat([groups.session_number.apply(len), groups.apply(lambda x: x.inserted.sum()/float(len(x)))],axis=1)
-    else:
-        groups = concat([groups.session_number.apply(len), (groups.apply(lambda x: x.inserted.sum()/float(len(x)))).head(n=threshold)],axis=1)
+
+def _start_end(response_times, groups, number_of_sessions, samples, response_time_threshold):
+    """Returns dict sample -> (mean response time of first sample answers, of last sample answers) of every session.
+    Forward and reverse ranks of answers in their sessions are computed once, every sample size is then
+    one masked reduction.
+
+    :param response_times: response times of answers sorted by session
+    :param groups: session of every answer
+    """
+
+    fast = response_times < response_time_threshold
+    groups, response_times = groups[fast], response_times[fast].astype(float64)
+    counts = bincount(groups, minlength=number_of_sessions)
+    position = arange(len(groups)) - (counts.cumsum()-counts)[groups] #position of answer in its session
+    reverse = counts[groups]-1-position #position of answer from the end of its session
+    result = {}
+    for sample in samples:
+        head = position < sample
+        tail = reverse < sample
+        sizes = minimum(counts, sample).astype(float64)
+        sizes[sizes == 0] = nan #sessions without fast answers have no mean
+        result[sample] = (bincount(groups[head], response_times[head], minlength=number_of_sessions)/sizes,
+                          bincount(groups[tail], response_times[tail], minlength=number_of_sessions)/sizes)
+    return result
+
+
+@memoized()
+def session_table(frame, sample=5, response_time_threshold=60000):
+    """Returns summary of every session of every user in one pass over answers -- one row per (user, session_number)
+    with columns start, end, duration (seconds), answers, first_questions (number of first questions),
+    correct (correctly answered first questions), response_time_start and response_time_end (mean response time
+    of first and last sample answers faster than response_time_threshold, NaN if there is none).
+
+    :param sample: number of answers at start and end of session
+    :param response_time_threshold: upper threshold for response times
+    """
+
+    order, users, sessions, starts, groups = _sessions(frame)
+    ends = concatenate([starts[1:], [len(order)]]).astype(int64)-1
+
+    inserted = frame.inserted.values[order]
+    first = session_first_question_mask(frame)[order]
+    correct = first & (frame.place_asked.values == frame.place_answered.values)[order]
+    result = DataFrame({'start': inserted[starts], 'end': inserted[ends]},
+                       index=MultiIndex.from_arrays([users, sessions], names=['user','session_number']),
+                       columns=['start','end'])
+    result['duration'] = (result.end-result.start).values.astype('timedelta64[ns]').astype(int64)/10.0**9
+    result['answers'] = bincount(groups, minlength=len(starts))
+    result['first_questions'] = bincount(groups, first, minlength=len(starts)).astype(int64)
+    result['correct'] = bincount(groups, correct, minlength=len(starts)).astype(int64)
+
+    start_end = _start_end(frame.response_time.values[order], groups, len(starts), [sample], response_time_threshold)
+    result['response_time_start'], result['response_time_end'] = start_end[sample]
+    return result
+
+
+@memoized()
+def start_end_response_times(frame, samples=[5], response_time_threshold=60000):
+    """Returns mean response times at start and at the end of every session for several sample sizes in one pass --
+    dict sample -> DataFrame with columns response_time_start and response_time_end indexed by (user, session_number),
+    same as in session_table with that sample.
+
+    :param samples: numbers of answers at start and end of session
+    :param response_time_threshold: upper threshold for response times
+    """
+
+    order, users, sessions, starts, groups = _sessions(frame)
+    index = MultiIndex.from_arrays([users, sessions], names=['user','session_number'])
+    start_end = _start_end(frame.response_time.values[order], groups, len(starts), samples, response_time_threshold)
+    return dict((sample, DataFrame({'response_time_start': start, 'response_time_end': end}, index=index,
+                                   columns=['response_time_start','response_time_end']))
+                for sample, (start, end) in start_end.items())
+
+
+def _per_session(sessions, column, threshold=None):
+    """Returns number of sessions and mean of column for every session number.
+
+    :param threshold: maximum number of sessions to return
+    """
+
+    groups = sessions[column].groupby(level='session_number')
+    result = groups.mean()
+    if threshold is not None:
+        result = result.head(n=threshold)
+    groups = concat([groups.count(), result], axis=1)
     groups.columns = ['counts','result']
     return groups
 
 
-def number_of_answers(frame,threshold=None):
+@memoized()
+def lengths_of_sessions(frame,threshold=None,sessions=None):
+    """Returns length of each session.
+
+    :param threshold: maximum number of sessions to return
+    :param sessions: session table of frame (see session_table) -- default is None (computed from frame)
+    """
+
+    if sessions is None:
+        sessions = session_table(frame)
+    return _per_session(sessions, 'duration', threshold)
+
+
+@memoized()
+def number_of_answers(frame,threshold=None,sessions=None):
     """Returns number of answers for each session.
 
     :param threshold: maximum number of sessions to return
+    :param sessions: session table of frame (see session_table) -- default is None (computed from frame)
     """
 
-    groups = frame.groupby(['user','session_number'])
-    groups = groups.apply(len)
-    groups = groups.reset_index().groupby('session_number')
-    if threshold is None:
-        groups = concat([groups.session_number.apply(len),groups.sum()[0]/groups.session_number.apply(len)],axis=1)
-    else:
-        groups = concat([groups.session_number.apply(len),groups.sum()[0]/groups.session_number.apply(len).head(n=threshold)],axis=1)
-    groups.columns = ['counts','result']
-    return groups
+    if sessions is None:
+        sessions = session_table(frame)
+    return _per_session(sessions, 'answers', threshold)
 
 
 def _success(frame):
@@ -50,13 +144,32 @@ def _success(frame):
     return first
 
 
-def success(frame, codes, reorder_sessions = False):
-    """Returns progress of success rate over sessions groupped by 'session_number','place_map','place_type'.
+def add_place_types(frame, codes, lookup=None):
+    """Returns answers with place_map filled in (225 for unknown maps) and place_type of place_asked. Answers of
+    every user are grouped by place in order of first answer to it, answers of places without type are left out.
+    Frames which already have place_type are returned as they are.
+
+    :param lookup: PlaceLookup of codes -- default is None (built from codes)
     """
 
+    if 'place_type' in frame:
+        return frame
     data = frame
     data.place_map = data.place_map.fillna(225)
-    data = add_place_type(data, codes)
+    order = argsort(factorize(pair_keys(data.user.values, data.place_asked.values))[0], kind='mergesort')
+    if lookup is None:
+        lookup = PlaceLookup(codes)
+    types, known = lookup.place_types(data.place_asked.values[order])
+    data = data.take(order[known])
+    data['place_type'] = types[known]
+    return data
+
+
+def success(frame, codes, reorder_sessions = False):
+    """Returns progress of success rate over sessions groupped by 'session_number','place_map','place_type'.
+    """
+
+    data = add_place_types(frame, codes)
     if reorder_sessions:
         data = data.groupby(['place_map','place_type'])
         data = data.apply(add_session_numbers)
@@ -73,48 +186,74 @@ def skill(frame, difficulties, codes, reorder_sessions = False):
     """Returns progress of prior skill over sessions for one user.
     """
 
-    data = frame
-    data.place_map = data.place_map.fillna(225)
-    data = add_place_type(data, codes)
+    data = add_place_types(frame, codes)
     if reorder_sessions:
         data = data.groupby(['place_map','place_type'])
         data = data.apply(add_session_numbers)
+    skills = estimate_prior_knowledge_batch(data, difficulties, ['session_number','place_map','place_type'])['skill']
     data = data.groupby(['session_number','place_map','place_type'])
-    data = concat([data.apply(len), data.apply(lambda x: estimate_prior_knowledge(x, difficulties)[0])], axis=1)
+    data = concat([data.apply(len), skills], axis=1)
     data.columns = ['counts','result']
     return data
 
 
+def _place_type_sessions(frame, codes, reorder_sessions=False):
+    """Returns answers of all users with place_type (see add_place_types) and, if reorder_sessions, with sessions
+    renumbered within every (user, place_map, place_type).
+    """
+
+    data = add_place_types(frame, codes)
+    if reorder_sessions:
+        data = add_session_numbers_by(data, ['user','place_map','place_type'])
+    return data
+
+
+def _average(results, grpby, threshold=None):
+    """Returns number of users and mean of their results (indexed by user, session_number, place_map, place_type)
+    for every group of grpby.
+    """
+
+    if results.empty:
+        return DataFrame(columns=['counts','result'])
+    data = results.reset_index(name='result').groupby(grpby)['result']
+    data = concat([data.size(), data.mean()], axis=1)
+    data.columns = ['counts','result']
+    return data[data.counts>threshold]
+
+
+@memoized()
 def average_success(frame, codes, threshold=None, grpby = ['session_number','place_map','place_type']):
-    """Returns progress of mean success rate over sessions. Multi-user version of success method
+    """Returns progress of mean success rate over sessions. Multi-user version of success method -- success rates
+    of all users and sessions are one grouped mean.
     
     :param threshold: lower threshold for counts
     """
 
-    data = first_questions(frame.groupby(['user','session_number']))
-    data = data.groupby('user')
-    data = data.apply(lambda x: success(x, codes, grpby==['session_number']))
-    data = data.reset_index()
-    data = data.groupby(grpby)
-    data = concat([data.apply(len), data.apply(lambda x: x.result.mean())],axis=1)
-    data.columns = ['counts','result']
-    return data[data.counts>threshold]
+    keys = ['user','session_number','place_map','place_type']
+    data = _place_type_sessions(session_first_questions(frame), codes, grpby==['session_number'])
+    data = data[first_question_mask(data, keys)]
+    correct = Series((data.place_asked.values == data.place_answered.values).astype(float64))
+    correct = correct.groupby([data[key].values for key in keys]).mean()
+    correct.index.names = keys
+    return _average(correct, grpby, threshold)
 
 
-def average_skill(frame, difficulties, codes, threshold=None, grpby = ['session_number','place_map','place_type']):
-    """Returns progress of mean prior skill over sessions. Multi-user version of skill method
+@memoized('processes')
+def average_skill(frame, difficulties, codes, threshold=None, grpby = ['session_number','place_map','place_type'], processes=None):
+    """Returns progress of mean prior skill over sessions. Multi-user version of skill method -- prior skills
+    of all users and sessions are estimated in one batch.
     
     :param threshold: lower threshold for counts
+    :param processes: evaluate users in this many processes (see parallel module) -- default is None (serially)
     """
 
-    data = first_questions(frame.groupby(['user','session_number']))
-    data = data.groupby('user')
-    data = data.apply(lambda x: skill(x, difficulties, codes, grpby==['session_number']))
-    data = data.reset_index()
-    data = data.groupby(grpby)
-    data = concat([data.apply(len), data.apply(lambda x: x.result.mean())],axis=1)
-    data.columns = ['counts','result']
-    return data[data.counts>threshold]
+    keys = ['user','session_number','place_map','place_type']
+    data = _place_type_sessions(session_first_questions(frame), codes, grpby==['session_number'])
+    if processes is None:
+        data = estimate_prior_knowledge_batch(data, difficulties, keys)
+    else:
+        data = estimate_prior_knowledge_parallel(data, difficulties, keys, processes)
+    return _average(data['skill'], grpby, threshold)
 
 
 '''def average(frame, func, threshold=None, grpby=['session_number','place_map','place_type']):
@@ -132,18 +271,36 @@ def average_skill(frame, difficulties, codes, threshold=None, grpby = ['session_
     return data[data.counts>threshold]'''
 
 
-def number_of_users(frame):
+@memoized()
+def number_of_users(frame,sessions=None):
     """Returns number of users that got to specific session.
+
+    :param sessions: session table of frame (see session_table) -- default is None (computed from frame)
     """
 
-    return frame.groupby('session_number').apply(lambda x: len(unique(x.user)))
+    if sessions is None:
+        sessions = session_table(frame)
+    return sessions.groupby(level='session_number').size()
 
 
-def response_time_start_end(frame, response_time_threshold=60000, sample = 5):
-    data = frame[frame.response_time<response_time_threshold]
-    data = data.groupby(['user','session_number'])
-    data = concat([data.apply(lambda x: x[:sample].response_time.mean()), data.apply(lambda x: x[-sample:].response_time.mean())], axis=1)
-    data = data.reset_index()
-    data = data.groupby('session_number')
-    data = data.apply(lambda x: x[0].mean())-data.apply(lambda x: x[1].mean())
-    return data
\ No newline at end of file
+def _start_end_difference(sessions):
+    data = sessions[['response_time_start','response_time_end']].dropna().groupby(level='session_number')
+    return data.response_time_start.mean()-data.response_time_end.mean()
+
+
+@memoized()
+def response_time_start_end(frame, response_time_threshold=60000, sample = 5, sessions=None):
+    """Returns mean difference between response times at start and at the end of sessions for every session number.
+
+    :param sample: number of answers at start and end of session, or list of them -- then a DataFrame with one column
+                   per sample size is returned (all sizes are evaluated in one pass)
+    :param sessions: session table of frame built with same sample and response_time_threshold
+                     (see session_table) -- default is None (computed from frame)
+    """
+
+    if isinstance(sample, (list, tuple)):
+        tables = start_end_response_times(frame, list(sample), response_time_threshold)
+        return DataFrame(dict((size, _start_end_difference(tables[size])) for size in sample), columns=list(sample))
+    if sessions is None:
+        sessions = session_table(frame, sample, response_time_threshold)
+    return _start_end_difference(sessions)
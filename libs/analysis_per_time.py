@@ -1,81 +1,106 @@
 # -*- coding: utf-8 -*-
 
 from pandas import DatetimeIndex, DataFrame, DateOffset, Series
-from numpy import arange
+from numpy import bincount, lexsort, flatnonzero, concatenate, cumsum, diff, unique, int64, float64
+from memo import memoized
 
+
+def _weekdays(inserted):
+    """Returns weekday (0 is Monday) of every datetime64[ns] value.
+    """
+
+    days = inserted.view(int64)//(24*3600*10**9)
+    return (days+3)%7 #1970-01-01 was Thursday
+
+
+def _hours(inserted):
+    """Returns hour of every datetime64[ns] value.
+    """
+
+    return (inserted.view(int64)//(3600*10**9))%24
+
+
+@memoized()
 def weekday_activity(frame):
-    """Returns counts of answers per weekdays (first value is Monday etc)
+    """Returns counts of answers per weekdays (first value is Monday etc). Counts of chunks are merged by addition.
     """
 
-    data = DataFrame()
-    data['weekday'] = DatetimeIndex(frame.inserted).weekday
-    counts = DataFrame(arange(7)*0)
-    return (counts[0]+data.weekday.value_counts()).fillna(0)
+    return Series(bincount(_weekdays(frame.inserted.values), minlength=7))
 
 
+@memoized()
 def hourly_activity(frame):
-    """Returns counts of answers per hour
+    """Returns counts of answers per hour. Counts of chunks are merged by addition.
     """
 
-    data = DataFrame()
-    data['hour'] = DatetimeIndex(frame.inserted).hour
-    counts = DataFrame(arange(24)*0)
-    return (counts[0]+data.hour.value_counts()).fillna(0)
+    return Series(bincount(_hours(frame.inserted.values), minlength=24))
+
+
+_OFFSETS = {'W': 7*24*3600*10**9, 'D': 24*3600*10**9} #length of period in nanoseconds
 
 
-def _success(frame, frequency='M'):
-    """Returns success rate for specific time period
+def _periods(frame, frequency='M'):
+    """Groups answers by (user, year, month/week/day of month) using integer codes computed once from inserted.
+
+    :returns: (order, starts, groups) -- order of answers sorted by group (stable, so the first answer of
+              a group is its first answer in frame), start of every group in order and group of every sorted answer
     """
 
+    times = DatetimeIndex(frame.inserted.values)
     if frequency == 'M':
-        result = frame[frame.inserted[0]:frame.inserted[0]+DateOffset(months=1)]
-    elif frequency== 'W':
-        result = frame[frame.inserted[0]:frame.inserted[0]+DateOffset(days=7)]
+        part = times.month
+    elif frequency == 'W':
+        part = times.week
     else:
-        result = frame[frame.inserted[0]:frame.inserted[0]+DateOffset(days=1)]
-    return len(result[result.place_asked==result.place_answered])/float(len(result)) if len(result) else None
+        part = times.day
+    periods = times.year.astype(int64)*100 + part
+    order = lexsort((periods, frame.user.values))
+    users = frame.user.values[order]
+    periods = periods[order]
+    new = concatenate([[True], (users[1:] != users[:-1]) | (periods[1:] != periods[:-1])])[:len(users)]
+    return (order, flatnonzero(new), cumsum(new)-1)
+
+
+def _by_date(values, dates, name):
+    """Returns Series of values indexed by dates (int64 nanoseconds).
+    """
 
+    return Series(values, index=DatetimeIndex(dates.view('datetime64[ns]')), name=name)
 
+
+@memoized()
 def success(frame, frequency = 'M'):
-    """Returns success rate for every time period
+    """Returns success rate for every time period -- mean of success rates of users in periods starting in it.
+    Only answers within one period from the first answer of user in the period count (months always whole).
     """
 
-    result = frame.set_index(DatetimeIndex(frame.inserted))
-    if frequency=='M':
-        result = result.groupby(['user',lambda x: x.year,lambda x: x.month])
-    elif frequency == 'W':
-        result = result.groupby(['user',lambda x: x.year,lambda x: x.week])
-    else:
-        result = result.groupby(['user',lambda x: x.year,lambda x: x.day])
-    result = result.apply(lambda x: Series({'success_rate':_success(x,frequency), 'date':x.inserted.values[0]}))
-    result = result.set_index(DatetimeIndex(result['date']))
-    result = result.resample(frequency, how='mean').success_rate
+    order, starts, groups = _periods(frame, frequency)
+    inserted = frame.inserted.values.view(int64)[order]
+    correct = (frame.place_asked.values == frame.place_answered.values)[order]
+    if frequency != 'M':
+        included = inserted <= inserted[starts][groups] + _OFFSETS.get(frequency, _OFFSETS['D'])
+        groups, correct = groups[included], correct[included]
+    rates = bincount(groups, correct, minlength=len(starts))/bincount(groups, minlength=len(starts)).astype(float64)
+    result = _by_date(rates, inserted[starts], 'success_rate').resample(frequency, how='mean')
     result.index = result.index - DateOffset(days=1)
     return result
 
 
+@memoized()
 def number_of_users(frame, frequency = 'M'):
-    """Returns number of users for every time period
+    """Returns number of users for every time period (by time of their first answer).
     """
 
-    times = frame.groupby('user').apply(lambda x: x.inserted.values[0])
-    times = times.reset_index()
-    times = times.set_index(DatetimeIndex(times[0]))
+    users, first = unique(frame.user.values, return_index=True)
+    times = DataFrame({'user': users}, index=DatetimeIndex(frame.inserted.values[first]))
     return times.resample(frequency,how=len).user
 
 
+@memoized()
 def number_of_answers(frame, frequency= 'M'):
-    """Returns number of answers for every time period
+    """Returns number of answers for every time period -- mean of numbers of answers of users in periods starting in it.
     """
 
-    
-    result = frame.set_index(DatetimeIndex(frame.inserted))
-    if frequency=='M':
-        result = result.groupby(['user',lambda x: x.year,lambda x: x.month])
-    elif frequency == 'W':
-        result = result.groupby(['user',lambda x: x.year,lambda x: x.week])
-    else:
-        result = result.groupby(['user',lambda x: x.year,lambda x: x.day])
-    result = result.apply(lambda x: Series({'length': len(x) if len(x) else None, 'date':x.inserted.values[0]}))
-    result = result.set_index(DatetimeIndex(result.date))
-    return result.resample(frequency,how='mean').length
\ No newline at end of file
+    order, starts, groups = _periods(frame, frequency)
+    lengths = diff(concatenate([starts, [len(order)]])).astype(float64)
+    return _by_date(lengths, frame.inserted.values.view(int64)[order][starts], 'length').resample(frequency,how='mean')
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+from numpy import save, load, argsort, unique, union1d, searchsorted, bincount, cumsum, append, concatenate, empty, zeros, sort, arange, int64
+from numpy.lib.format import open_memmap
+from pandas import DataFrame, Index
+from yaml import dump
+from yaml import load as load_yaml
+from os import path, makedirs, rename, remove
+from shutil import rmtree, copyfile
+from collections import OrderedDict
+
+"""Memory-mapped answer store. Answers are physically sorted by user, so all answers of one user are a contiguous
+range of rows. Secondary index holds permutation of rows sorted by place_asked.
+"""
+
+
+def decode_column(values, kind, labels=None):
+    """Converts stored column back to its pandas representation.
+
+    :param values: stored values (int64 nanoseconds for datetimes, int32 codes for objects)
+    :param kind: 'datetime'/'object'/'plain'
+    :param labels: array of labels for 'object' columns
+    """
+
+    if kind == 'datetime':
+        return values.view('datetime64[ns]')
+    elif kind == 'object':
+        if len(labels):
+            result = labels.astype(object).take(values)
+        else:
+            result = empty(len(values), dtype=object)
+        result[values == -1] = float('nan')
+        return result
+    return values
+
+
+def _create(path, kind, length):
+    """Returns new .npy file of length values opened for writing.
+    """
+
+    if not length:
+        save(path, empty(0, dtype=kind))
+        return load(path)
+    return open_memmap(path, mode='w+', dtype=kind, shape=(length,))
+
+
+def _chunks(length, chunksize):
+    return [slice(start, min(start+chunksize, length)) for start in xrange(0, length, chunksize)]
+
+
+def _count_keys(values, chunksize):
+    """Returns sorted unique keys of values and their counts, read chunk by chunk.
+    """
+
+    keys, counts = zeros(0, dtype=values.dtype), zeros(0, dtype=int64)
+    for rows in _chunks(len(values), chunksize):
+        chunk_keys, inverse = unique(values[rows], return_inverse=True)
+        merged = union1d(keys, chunk_keys)
+        merged_counts = zeros(len(merged), dtype=int64)
+        merged_counts[searchsorted(merged, keys)] += counts
+        merged_counts[searchsorted(merged, chunk_keys)] += bincount(inverse, minlength=len(chunk_keys))
+        keys, counts = merged, merged_counts
+    return keys, counts
+
+
+def _write_positions(values, keys, counts, out, chunksize):
+    """Writes position of every value in stable sort of values by key into out (counting sort, chunk by chunk).
+    """
+
+    cursor = (cumsum(counts)-counts).astype(int64)
+    for rows in _chunks(len(values), chunksize):
+        codes = searchsorted(keys, values[rows])
+        order = argsort(codes, kind='mergesort')
+        chunk_counts = bincount(codes, minlength=len(keys))
+        rank = empty(len(codes), dtype=int64)
+        rank[order] = arange(len(codes)) - (cumsum(chunk_counts)-chunk_counts)[codes[order]]
+        out[rows] = cursor[codes] + rank
+        cursor += chunk_counts
+
+
+def build_answer_store(directory, meta, chunksize=1000000):
+    """Builds answer store from columnar cache (see input_output.save_answer_cache) into directory+'/store'.
+    Rows are sorted by user with counting sort chunk by chunk -- memory is bounded by chunksize and numbers
+    of users and places, columns are scattered into memory-mapped files one by one.
+
+    :param directory: cache directory
+    :param meta: meta information of the cache
+    :param chunksize: number of rows processed at once
+    """
+
+    target = directory+'/store'
+    temp = target+'.tmp'
+    if path.exists(temp):
+        rmtree(temp)
+    makedirs(temp)
+    length = meta['length']
+
+    users = load(directory+'/user.npy', mmap_mode='r')
+    user_ids, user_counts = _count_keys(users, chunksize)
+    positions = _create(temp+'/positions.npy', int64, length) #row of every cached answer in the store
+    _write_positions(users, user_ids, user_counts, positions, chunksize)
+    del users
+
+    for name in meta['columns']+['id']:
+        values = load(directory+'/'+name+'.npy', mmap_mode='r')
+        out = _create(temp+'/'+name+'.npy', values.dtype, length)
+        for rows in _chunks(length, chunksize):
+            out[positions[rows]] = values[rows]
+        del out, values
+        if meta['kinds'].get(name) == 'object':
+            copyfile(directory+'/'+name+'.labels.npy', temp+'/'+name+'.labels.npy')
+    del positions
+    remove(temp+'/positions.npy')
+    save(temp+'/user_ids.npy', user_ids)
+    save(temp+'/user_offsets.npy', append(0, cumsum(user_counts)).astype(int64))
+
+    places = load(temp+'/place_asked.npy', mmap_mode='r')
+    place_ids, place_counts = _count_keys(places, chunksize)
+    positions = _create(temp+'/positions.npy', int64, length)
+    _write_positions(places, place_ids, place_counts, positions, chunksize)
+    place_order = _create(temp+'/place_order.npy', int64, length)
+    for rows in _chunks(length, chunksize):
+        place_order[positions[rows]] = arange(rows.start, rows.stop)
+    del places, positions, place_order
+    remove(temp+'/positions.npy')
+    save(temp+'/place_ids.npy', place_ids)
+    save(temp+'/place_offsets.npy', append(0, cumsum(place_counts)).astype(int64))
+
+    with open(temp+'/meta.yaml', 'w') as out:
+        dump({'columns': meta['columns'], 'kinds': meta['kinds'], 'length': length}, out)
+    if path.exists(target):
+        rmtree(target)
+    rename(temp, target)
+
+
+class AnswerStore():
+    def __init__(self, directory):
+        """Opens answer store made by build_answer_store. All columns are memory-mapped, so opening the store
+        does not read the answers.
+
+        :param directory: store directory
+        """
+
+        with open(directory+'/meta.yaml') as meta:
+            meta = load_yaml(meta)
+        self.directory = directory
+        self.columns = meta['columns']
+        self.kinds = meta['kinds']
+        self.length = meta['length']
+
+        self._data = OrderedDict((name, load(directory+'/'+name+'.npy', mmap_mode='r')) for name in self.columns)
+        self._ids = load(directory+'/id.npy', mmap_mode='r')
+        self._labels = dict((name, load(directory+'/'+name+'.labels.npy'))
+                            for name in self.columns if self.kinds[name] == 'object')
+
+        self.user_ids = load(directory+'/user_ids.npy')
+        self.user_offsets = load(directory+'/user_offsets.npy')
+        self.place_ids = load(directory+'/place_ids.npy')
+        self.place_offsets = load(directory+'/place_offsets.npy')
+        self.place_order = load(directory+'/place_order.npy', mmap_mode='r')
+
+
+    @staticmethod
+    def exists(directory):
+        return path.exists(directory+'/meta.yaml')
+
+
+    def __len__(self):
+        return self.length
+
+
+    def _frame(self, rows):
+        """Returns DataFrame of selected rows. Only these rows are read from the mapped files, but they are copied
+        into the frame (DataFrame consolidates columns into its own blocks).
+
+        :param rows: slice or array of row positions
+        """
+
+        columns = OrderedDict()
+        for name, values in self._data.items():
+            columns[name] = decode_column(values[rows], self.kinds[name], self._labels.get(name))
+        return DataFrame(columns, index=Index(self._ids[rows], name='id'), columns=self.columns)
+
+
+    def ids(self):
+        """Returns memory-mapped ids of all answers (in order of the store).
+        """
+
+        return self._ids
+
+
+    def user_range(self, user):
+        """Returns (start, end) of rows of user -- (0, 0) if there is no such user.
+        """
+
+        i = self.user_ids.searchsorted(user)
+        if i == len(self.user_ids) or self.user_ids[i] != user:
+            return (0, 0)
+        return (self.user_offsets[i], self.user_offsets[i+1])
+
+
+    def _place_rows(self, place):
+        i = self.place_ids.searchsorted(place)
+        if i == len(self.place_ids) or self.place_ids[i] != place:
+            return self.place_order[0:0]
+        return self.place_order[self.place_offsets[i]:self.place_offsets[i+1]]
+
+
+    def users(self, users):
+        """Returns answers of users. One user is a plain slice of the store.
+
+        :param users: list of user IDs
+        """
+
+        if len(users) == 1:
+            start, end = self.user_range(users[0])
+            return self._frame(slice(start, end))
+        rows = [arange(*self.user_range(user)) for user in users]
+        return self._frame(concatenate(rows).astype(int64) if rows else empty(0, dtype=int64))
+
+
+    def places(self, places):
+        """Returns answers of places (by place_asked) by single gather of rows through place index.
+
+        :param places: list of place IDs
+        """
+
+        rows = [self._place_rows(place) for place in places]
+        return self._frame(sort(concatenate(rows)) if rows else empty(0, dtype=int64))
+
+
+    def iter_chunks(self, chunksize=1000000):
+        """Yields answers in chunks of about chunksize rows. Chunks end on user boundaries, so every user
+        has whole history in one chunk (a user with more than chunksize answers gets a chunk of their own).
+
+        :param chunksize: number of rows in one chunk
+        """
+
+        start = 0
+        while start < self.length:
+            i = self.user_offsets.searchsorted(start+chunksize)
+            end = self.user_offsets[i] if i < len(self.user_offsets) else self.length
+            yield self._frame(slice(start, end))
+            start = end
+
+
+    def empty(self):
+        """Returns DataFrame without answers (with columns and dtypes of the store).
+        """
+
+        return self._frame(slice(0, 0))
+
+
+    def frame(self):
+        """Returns all answers (sorted by user).
+        """
+
+        return self._frame(slice(0, self.length))
@@ -1,4 +1,4 @@
-from numpy import log2
+from numpy import log2, asarray, sort, cumsum, concatenate, zeros, arange, minimum, flatnonzero, searchsorted, random, unique, float64, int64
 from sys import maxint
 from sys import float_info
 
@@ -53,7 +53,7 @@ class Jenks(ClassificationMethod):
         http://danieljlewis.org/2010/06/07/jenks-natural-breaks-algorithm-in-python/
         '''
 
-        data.sort()
+        data = sorted(data)
 
         #unreadable one liners
         #mat1 = [[0 for j in range(number_of_classes+1)] for i in range(len(data))] 
@@ -111,4 +111,84 @@ class Jenks(ClassificationMethod):
 
             breaks[i - 1] = data[id] 
             k = int((mat1[k][i] - 1))
-        return breaks
\ No newline at end of file
+        return breaks
+
+
+def _ssq(s1, s2, j, i):
+    """Returns sum of squared deviations of sorted values j..i-1 from their mean (from prefix sums s1, s2).
+    """
+
+    return s2[i]-s2[j] - (s1[i]-s1[j])**2/(i-j)
+
+
+def _next_class(previous, s1, s2):
+    """Returns (cost, start) of optimal division of every prefix of sorted values into one class more than previous --
+    cost[i] = min over j of previous[j] + _ssq(j, i) and start[i] is the smallest such j (start of the last class).
+    Optimal starts are monotone in i, so all i are solved by divide and conquer over i with shrinking ranges of j,
+    one vectorized step for every level of the recursion.
+    """
+
+    n = len(s1)-1
+    cost = zeros(n+1, dtype=float64)
+    start = zeros(n+1, dtype=int64)
+    start[0] = -1 #as mat1[0] of Jenks, read back only when there are fewer distinct values than classes
+    lo, hi, opt_lo, opt_hi = [asarray(x, dtype=int64)[:int(n >= 2)] for x in [[2], [n], [1], [n-1]]]
+    while len(lo):
+        mid = (lo+hi)//2
+        lengths = minimum(mid-1, opt_hi)-opt_lo+1
+        offsets = cumsum(lengths)-lengths
+        j = opt_lo.repeat(lengths) + arange(lengths.sum()) - offsets.repeat(lengths)
+        values = previous[j] + _ssq(s1, s2, j, mid.repeat(lengths))
+        best = minimum.reduceat(values, offsets)
+        first = flatnonzero(values == best.repeat(lengths))
+        opt = j[first[searchsorted(first, offsets)]]
+        cost[mid], start[mid] = best, opt
+        left, right = mid > lo, mid < hi
+        lo, hi = concatenate([lo[left], mid[right]+1]), concatenate([mid[left]-1, hi[right]])
+        opt_lo, opt_hi = concatenate([opt_lo[left], opt[right]]), concatenate([opt[left], opt_hi[right]])
+    return (cost, start)
+
+
+class Ckmeans(ClassificationMethod):
+    def __init__(self, sample_size=None, seed=0):
+        """Optimal 1-D classification (Ckmeans) in O(k*n*log(n)) on sorted prefix sums -- ties are broken as in Jenks,
+        so breaks are the same whenever sums of the values are exact (floats may round near-ties differently).
+
+        :param sample_size: classify random sample of this many values (plus minimum and maximum) when there are more
+                            -- default is None (classify all values)
+        :param seed: seed of the sample
+        """
+
+        self.sample_size = sample_size
+        self.seed = seed
+
+
+    def classify(self, data, number_of_classes=6):
+        """Data is divided into classes with minimal sum of squared deviations from class means.
+
+        :param data: values to bin (not modified)
+        :param number_of_classes: divide values into this many bins
+        """
+
+        values = sort(asarray(data, dtype=float64))
+        if len(values) <= number_of_classes:
+            return Jenks().classify(list(data), number_of_classes)
+        if self.sample_size is not None and len(values) > self.sample_size:
+            rows = random.RandomState(self.seed).choice(len(values), self.sample_size, replace=False)
+            values = values[unique(concatenate([[0, len(values)-1], rows]))]
+
+        s1 = concatenate([[0], cumsum(values)])
+        s2 = concatenate([[0], cumsum(values*values)])
+        cost = concatenate([[0], _ssq(s1, s2, zeros(len(values), dtype=int64), arange(1, len(values)+1))])
+        starts = []
+        for i in xrange(2, number_of_classes+1):
+            cost, start = _next_class(cost, s1, s2)
+            starts.append(start)
+
+        breaks = [0 for i in xrange(number_of_classes+1)]
+        breaks[-1] = values[-1]
+        k = len(values)
+        for i in reversed(xrange(2, number_of_classes+1)):
+            k = starts[i-2][k]
+            breaks[i-1] = values[k-1]
+        return breaks
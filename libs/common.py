@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from colorsys import hsv_to_rgb
-from numpy import timedelta64
+from numpy import timedelta64, lexsort, cumsum, diff, flatnonzero, concatenate, zeros, ones, empty, arange, where, asarray, int64
+from pandas import MultiIndex
 from math import exp
 from random import shuffle
 
@@ -25,10 +26,50 @@ def logis(value):
     return (1.0 / (1 + exp(-value)))
 
 
-def add_place_type(frame, codes):
-    c = codes.type
-    c.name = 'place_type'
-    return frame.join(c, on=['place_asked'], how='right')
+def dense_lookup(keys, values, fill):
+    """Returns array of values indexed by their (non-negative integer) keys, fill for keys without value.
+    """
+
+    keys = asarray(keys).astype(int64)
+    result = empty(int(keys.max())+1 if len(keys) else 0, dtype=asarray(values).dtype)
+    result.fill(fill)
+    result[keys] = values
+    return result
+
+
+class PlaceLookup():
+    def __init__(self, codes):
+        """Dense arrays of places from geography.place csv -- row of codes, code and name indexed by place id and
+        place type indexed by row label of codes (the key place_asked is joined on).
+
+        :param codes: dataframe with geography.place info
+        """
+
+        self.row = dense_lookup(codes.id.values, arange(len(codes)), -1)
+        self.code = dense_lookup(codes.id.values, codes.code.values, None)
+        self.name = dense_lookup(codes.id.values, codes.name.values, None)
+        self.type = dense_lookup(codes.index.values, codes.type.values, 0)
+        self.known = dense_lookup(codes.index.values, ones(len(codes), dtype=bool), False)
+
+
+    def rows(self, ids):
+        """Returns rows of codes of places (places not in codes are left out).
+        """
+
+        ids = asarray(ids).astype(int64)
+        rows = self.row[ids[(ids >= 0) & (ids < len(self.row))]]
+        return rows[rows >= 0]
+
+
+    def place_types(self, places):
+        """Returns (place types, whether place has a type) of places.
+        """
+
+        places = asarray(places).astype(int64)
+        inside = (places >= 0) & (places < len(self.known))
+        known = inside.copy()
+        known[inside] = self.known[places[inside]]
+        return (self.type[where(known, places, 0)] if len(self.type) else zeros(len(places), dtype=self.type.dtype), known)
 
 
 def add_session_numbers(frame,session_duration=timedelta64(30, 'm')):
@@ -42,6 +83,55 @@ def add_session_numbers(frame,session_duration=timedelta64(30, 'm')):
     return result
 
 
+def add_session_numbers_by_user(frame,session_duration=timedelta64(30, 'm')):
+    """Assignes session number to every answer of every user at once -- one sort by (user, inserted),
+    vectorized gap test and cumulative sum restarted at every user. Same result (including (user, id) index)
+    as frame.groupby('user').apply(add_session_numbers).
+
+    :param session_duration: duration of one session
+    """
+
+    order = lexsort((frame.inserted.values.view(int64), frame.user.values))
+    result = frame.take(order)
+    users = result.user.values
+    inserted = result.inserted.values.view(int64)
+    duration = session_duration.astype('timedelta64[ns]').astype(int64)
+
+    new_user = concatenate([[True], users[1:] != users[:-1]])[:len(users)]
+    new_session = concatenate([[False], diff(inserted) > duration])[:len(users)] & ~new_user
+    sessions = cumsum(new_session)
+    starts = flatnonzero(new_user)
+    result['session_number'] = sessions - sessions[starts].repeat(diff(concatenate([starts, [len(users)]])))
+
+    ids = result.index.get_level_values('id') if isinstance(result.index, MultiIndex) else result.index
+    result.index = MultiIndex.from_arrays([users, ids.values], names=['user', 'id'])
+    return result
+
+
+def add_session_numbers_by(frame, by, session_duration=timedelta64(30, 'm')):
+    """Assignes session number to every answer within every group of by at once -- one sort by (by, inserted) and
+    cumulative sum of gaps restarted at every group. Same session numbers as frame.groupby(by).apply(add_session_numbers),
+    rows are sorted by (by, inserted).
+
+    :param by: columns defining groups
+    :param session_duration: duration of one session
+    """
+
+    order = lexsort([frame.inserted.values.view(int64)]+[frame[column].values for column in reversed(by)])
+    result = frame.take(order)
+    new_group = zeros(len(result), dtype=bool)
+    for column in by:
+        values = result[column].values
+        new_group[1:] |= values[1:] != values[:-1]
+    new_group[:1] = True
+    duration = session_duration.astype('timedelta64[ns]').astype(int64)
+    new_session = concatenate([[False], diff(result.inserted.values.view(int64)) > duration])[:len(result)] & ~new_group
+    sessions = cumsum(new_session)
+    starts = flatnonzero(new_group)
+    result['session_number'] = sessions - sessions[starts].repeat(diff(concatenate([starts, [len(result)]])))
+    return result
+
+
 def add_item_numbers(frame):
     """Assignes number to each answer.
     """
@@ -50,6 +140,25 @@ def add_item_numbers(frame):
     return data
 
 
+def item_numbers(frame, by=['user']):
+    """Returns number of every answer among answers of its group of by (in order of frame) -- cumulative count
+    computed in one pass, same numbers as frame.groupby(by).apply(add_item_numbers).
+
+    :param by: columns defining groups -- default is ['user']
+    """
+
+    order = lexsort([frame[column].values for column in reversed(by)]) #stable -- answers of group stay in order of frame
+    new_group = zeros(len(frame), dtype=bool)
+    new_group[:1] = True
+    for column in by:
+        values = frame[column].values[order]
+        new_group[1:] |= values[1:] != values[:-1]
+    starts = flatnonzero(new_group)
+    numbers = empty(len(frame), dtype=int64)
+    numbers[order] = arange(len(frame)) - starts.repeat(diff(concatenate([starts, [len(frame)]])))
+    return numbers
+
+
 def defaultdict_factory():
     return (0,0)
 
@@ -61,6 +170,43 @@ def first_questions(frame):
     return frame.apply(lambda x: x.drop_duplicates(['place_asked']))
 
 
+def first_question_mask(frame, by=['user','session_number']):
+    """Returns boolean array marking first answer to every place within groups of by, in one hashing pass
+    over the whole frame.
+
+    :param by: columns defining groups -- default is ['user','session_number'] (sessions)
+    """
+
+    return ~frame.duplicated(by+['place_asked']).values
+
+
+def add_first_questions(frame):
+    """Adds column first_question (see first_question_mask), so later calls of session_first_questions are
+    a plain filter. The column describes the frame it was added to -- rows dropped afterwards are not accounted for.
+    """
+
+    frame['first_question'] = first_question_mask(frame)
+    return frame
+
+
+def session_first_questions(frame):
+    """Returns first questions for every session of every user. Same rows as
+    first_questions(frame.groupby(['user','session_number'])), but in order of frame and with its index.
+    Uses column first_question if the frame has it.
+    """
+
+    return frame[session_first_question_mask(frame)]
+
+
+def session_first_question_mask(frame):
+    """Returns first_question_mask of sessions, from column first_question if the frame has it.
+    """
+
+    if 'first_question' in frame:
+        return frame.first_question.values
+    return first_question_mask(frame)
+
+
 def get_session_length(frame):
     """Calculates session lengths in seconds.
     """
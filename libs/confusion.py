@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+from numpy import timedelta64, unique, lexsort, concatenate, flatnonzero, searchsorted, bincount, argsort, diff, isnan, float64, int64
+from pandas import Series, DataFrame, Index
+
+"""Sparse place_asked x place_answered confusion matrix of all answers and of first questions.
+Rows of places are plain slices, so mistaken places of one place are a lookup instead of a pass over answers.
+"""
+
+
+class ConfusionMatrix():
+    def __init__(self, asked, indptr, answered, counts, first_counts, totals, first_totals):
+        """Sparse (CSR) matrix of numbers of answers. Rows are place_asked, columns are place_answered.
+        Row i holds answered[indptr[i]:indptr[i+1]] with counts of all answers and of first questions.
+
+        :param asked: sorted place_asked IDs of rows
+        :param totals: number of all answers of every row (including answers without place_answered)
+        :param first_totals: number of first questions of every row (including answers without place_answered)
+        """
+
+        self.asked = asked
+        self.indptr = indptr
+        self.answered = answered
+        self.counts = counts
+        self.first_counts = first_counts
+        self.totals = totals
+        self.first_totals = first_totals
+
+
+    def _row(self, place):
+        i = searchsorted(self.asked, place)
+        if i == len(self.asked) or self.asked[i] != place:
+            return None
+        return i
+
+
+    def row(self, place, first=True):
+        """Returns counts of answered places for answers to place, sorted by count (descending, ties by place ID).
+
+        :param first: count only first questions -- default is True
+        """
+
+        i = self._row(place)
+        if i is None:
+            return Series([], index=Index([], dtype=float64), dtype=int64)
+        start, end = self.indptr[i], self.indptr[i+1]
+        counts = (self.first_counts if first else self.counts)[start:end]
+        order = argsort(-counts, kind='mergesort')
+        order = order[counts[order] > 0]
+        return Series(counts[order], index=Index(self.answered[start:end][order].astype(float64)))
+
+
+    def mistaken_places(self, place, threshold=None):
+        """Returns counts of places mistaken for place and number of first questions, same as
+        analysis_per_place.mistaken_places of answers to this place.
+
+        :param threshold: only return top counts -- default is None (which means return all)
+        """
+
+        i = self._row(place)
+        row = self.row(place)
+        row = row[row.index.values != place][:threshold]
+        row.index.name = 'code'
+        return (row, 0 if i is None else int(self.first_totals[i]))
+
+
+    def answer_portions(self, place, threshold=None):
+        """Returns portions of answers for place, same as analysis_assorted.answer_portions of answers to this place.
+
+        :param threshold: limit of values to include as separate slice -- default is None
+        """
+
+        mistaken = self.mistaken_places(place)[0]
+        correct = self.row(place, first=False)
+        mistaken = mistaken.append(Series({place: correct.values[correct.index.values == place].sum()}))
+        mistaken = mistaken/float(mistaken.sum())
+        if threshold is None:
+            return mistaken
+        else:
+            return (mistaken[mistaken>=threshold]*100).append(Series({0:mistaken[mistaken<threshold].sum()*100}))
+
+
+    def most_confused(self, k=10, first=True):
+        """Returns k most frequent pairs of different asked and answered places.
+
+        :param first: count only first questions -- default is True
+        """
+
+        asked = self.asked.repeat(diff(self.indptr))
+        counts = self.first_counts if first else self.counts
+        wrong = flatnonzero((asked != self.answered) & (counts > 0))
+        top = wrong[argsort(-counts[wrong], kind='mergesort')[:k]]
+        return DataFrame({'place_asked': asked[top], 'place_answered': self.answered[top], 'count': counts[top]},
+                         columns=['place_asked', 'place_answered', 'count'])
+
+
+def first_answers_of_places(frame, session_duration=timedelta64(30, 'm')):
+    """Returns mask of answers which are first answers of user to their place after a pause longer than session_duration
+    -- same first questions as in frame filtered to one place (with its own session numbers).
+    """
+
+    order = lexsort((frame.inserted.values.view(int64), frame.place_asked.values, frame.user.values))
+    users = frame.user.values[order]
+    places = frame.place_asked.values[order]
+    inserted = frame.inserted.values.view(int64)[order]
+    duration = session_duration.astype('timedelta64[ns]').astype(int64)
+    first = concatenate([[True], (users[1:] != users[:-1]) | (places[1:] != places[:-1]) | (diff(inserted) > duration)])[:len(users)]
+    result = first.copy()
+    result[order] = first
+    return result
+
+
+def build_confusion_matrix(frame, session_duration=timedelta64(30, 'm')):
+    """Returns ConfusionMatrix of all answers of frame.
+
+    :param frame: DataFrame or AnswerStore (read in chunks, which end on user boundaries)
+    """
+
+    chunks = frame.iter_chunks() if hasattr(frame, 'iter_chunks') else [frame]
+    asked, answered, first = [], [], []
+    for chunk in chunks:
+        asked.append(chunk.place_asked.values.astype(int64))
+        answered.append(chunk.place_answered.values.astype(float64))
+        first.append(first_answers_of_places(chunk, session_duration))
+    asked, answered, first = concatenate(asked), concatenate(answered), concatenate(first)
+
+    known = ~isnan(answered)
+    keys = asked[known]*2**16 + answered[known].astype(int64)
+    pairs, inverse = unique(keys, return_inverse=True)
+    counts = bincount(inverse, minlength=len(pairs))
+    first_counts = bincount(inverse, first[known], minlength=len(pairs)).astype(int64)
+
+    rows = pairs//2**16
+    ids = unique(asked)
+    indptr = searchsorted(rows, concatenate([ids, [ids[-1]+1 if len(ids) else 0]]))
+    position = searchsorted(ids, asked)
+    return ConfusionMatrix(ids, indptr.astype(int64), pairs%2**16, counts.astype(int64), first_counts,
+                           bincount(position, minlength=len(ids)).astype(int64),
+                           bincount(position, first, minlength=len(ids)).astype(int64))
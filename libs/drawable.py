@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
 
-from common import add_session_numbers
+from common import add_session_numbers_by_user, add_first_questions, session_first_questions, PlaceLookup
+from answer_store import AnswerStore
+from analysis_per_session import session_table, add_place_types
+from analysis_assorted import items
+from activity import build_activity_cube
+from analysis_per_place import place_metrics
+from confusion import build_confusion_matrix
+from quantiles import response_time_sketch
+from parallel import estimate_current_knowledge_parallel
+from elo_rating_system import estimate_current_knowledge_batch
 
 class Drawable():
     def __init__(self,path, frame, prior, codes, users=[], places=[]):
         """Drawable object should have assigned path, codes and DataFrame. 
 
         :param path: default output directory
-        :param frame: dataframe to save
+        :param frame: dataframe to save (or AnswerStore -- then only filtered answers are read from it)
         :param prior: prior knowledge dict
         :param codes: dataframe with geography.place info
         :param users: filter by list of user IDs -- default [] -- no filter
@@ -19,34 +28,182 @@ class Drawable():
         self.codes = codes
         self.users = users
         self.places = places
-
+        self.processes = None
+        self.derived = {}
+
+        if isinstance(frame, AnswerStore):
+            if users:
+                self.frame = frame.users(users)
+                users = []
+            elif places:
+                self.frame = frame.places(places)
+                places = []
+            else:
+                self.frame = frame.frame()
         if users:
             self.frame = self.frame[self.frame.user.isin(users)]
         if places:
             self.frame = self.frame[self.frame.place_asked.isin(places)]
 
-        self.frame = self.frame.groupby('user').apply(add_session_numbers)
+        self.frame = add_first_questions(add_session_numbers_by_user(self.frame))
         self.frame.sort()
 
 
     def set_frame(self,frame):
         self.frame = frame
+        self.derived = {}
+
+
+    def get_derived(self, key, func):
+        """Returns intermediate data computed by func on first use. It is kept until set_frame, set_prior or set_codes.
+
+        :param key: name of intermediate data (with its parameters)
+        :param func: function without arguments which computes it
+        """
+
+        if key not in self.derived:
+            self.derived[key] = func()
+        return self.derived[key]
+
+
+    def get_sessions(self, sample=5, response_time_threshold=60000):
+        """Returns session table of frame (see analysis_per_session.session_table).
+        """
+
+        return self.get_derived(('sessions', sample, response_time_threshold),
+                                lambda: session_table(self.frame, sample, response_time_threshold))
+
+
+    def set_sessions(self, sessions, sample=5, response_time_threshold=60000):
+        """Sets precomputed session table (e.g. joined from chunks, see streaming.sessions).
+        """
+
+        self.derived[('sessions', sample, response_time_threshold)] = sessions
+
+
+    def get_first_questions(self):
+        """Returns first questions of every session (see common.session_first_questions).
+        """
+
+        return self.get_derived('first_questions', lambda: session_first_questions(self.frame))
+
+
+    def get_place_types(self):
+        """Returns first questions with place types (see analysis_per_session.add_place_types).
+        """
+
+        return self.get_derived('place_types', lambda: add_place_types(self.get_first_questions().copy(), self.codes, self.get_place_lookup()))
+
+
+    def get_items(self):
+        """Returns numbered first questions (see analysis_assorted.items).
+        """
+
+        return self.get_derived('items', lambda: items(self.frame))
+
+
+    def get_place_metrics(self, threshold=60000):
+        """Returns table of metrics of every place (see analysis_per_place.place_metrics).
+        """
+
+        return self.get_derived(('place_metrics', threshold), lambda: place_metrics(self.frame, threshold))
+
+
+    def set_place_metrics(self, metrics, threshold=60000):
+        """Sets precomputed table of metrics of every place (e.g. merged from chunks, see streaming.place_metrics).
+        """
+
+        self.derived[('place_metrics', threshold)] = metrics
+
+
+    def get_response_time_sketch(self):
+        """Returns quantile sketch of response times of frame (see quantiles.QuantileSketch).
+        """
+
+        return self.get_derived('response_time_sketch', lambda: response_time_sketch(self.frame))
+
+
+    def set_response_time_sketch(self, sketch):
+        """Sets precomputed quantile sketch of response times (e.g. merged from chunks, see streaming.response_time_sketch).
+        """
+
+        self.derived['response_time_sketch'] = sketch
+
+
+    def get_activity(self):
+        """Returns activity cube of frame (see activity.ActivityCube).
+        """
+
+        return self.get_derived('activity', lambda: build_activity_cube(self.frame))
+
+
+    def set_activity(self, cube):
+        """Sets precomputed activity cube of frame (e.g. the stored cube of the whole dataset).
+        """
+
+        self.derived['activity'] = cube
+
+
+    def get_confusion(self):
+        """Returns confusion matrix of asked and answered places of frame (see confusion.ConfusionMatrix).
+        """
+
+        return self.get_derived('confusion', lambda: build_confusion_matrix(self.frame))
+
+
+    def set_confusion(self, matrix):
+        """Sets precomputed confusion matrix (e.g. the stored matrix of the whole dataset).
+        """
+
+        self.derived['confusion'] = matrix
+
+
+    def get_knowledge_matrix(self):
+        """Returns current skills of users of frame (see elo_rating_system.KnowledgeMatrix), estimated in processes
+        when they are set.
+        """
+
+        if self.processes is None:
+            return self.get_derived('knowledge', lambda: estimate_current_knowledge_batch(self.get_first_questions(), self.prior[0]))
+        return self.get_derived('knowledge', lambda: estimate_current_knowledge_parallel(self.get_first_questions(), self.prior[0], self.processes))
+
+
+    def set_knowledge_matrix(self, matrix):
+        """Sets precomputed skills of users (e.g. the stored matrix of the whole dataset).
+        """
+
+        self.derived['knowledge'] = matrix
 
 
     def set_prior(self,prior):
         self.prior = prior
+        self.derived = {}
+
+
+    def set_processes(self,processes):
+        """Sets number of processes used for estimating skills of users -- None means serially.
+        """
+
+        self.processes = processes
 
 
     def set_path(self,path):
         self.path = path
 
 
+    def get_place_lookup(self):
+        """Returns dense lookup arrays of codes (see common.PlaceLookup).
+        """
+
+        return self.get_derived('place_lookup', lambda: PlaceLookup(self.codes))
+
+
     def get_country_record(self,id):
-        return self.codes[self.codes.id==id]
+        return self.codes.take(self.get_place_lookup().rows([id]))
 
 
     def get_country_code(self,id):
-        return self.get_country_record(id)['code'].values[0]
+        return self.get_place_lookup().code[int(id)]
 
 
     def get_label(self, mapa, type):
@@ -54,11 +211,12 @@ class Drawable():
 
 
     def get_country_name(self,id):
-        return self.get_country_record(id)['name'].values[0]
+        return self.get_place_lookup().name[int(id)]
 
 
     def set_codes(self,codes):
         self.codes = codes
+        self.derived = {}
 
 
     def get_place_type_name(self,id):
@@ -2,8 +2,11 @@
 
 from common import defaultdict_factory, first_questions, logis
 
-from collections import defaultdict
-
+from collections import defaultdict, Mapping
+from itertools import izip
+from math import exp
+from numpy import zeros, unique, argsort, lexsort, sort, array, append, concatenate, union1d, searchsorted, arange, bincount, cumsum, where, exp as vexp, int64, float64
+from pandas import MultiIndex, Index, DataFrame, Series, notnull
 
 
 def _elo(answer, prior_skill, user_number_of_answers, difficulty, place_number_of_answers):
@@ -50,24 +53,425 @@ def estimate_prior_knowledge(frame, difficulties):
     return prior_skill
 
 
-def calculate_difficulties(frame):
-    """Calculates difficulty for every country
+def difficulty_array(difficulties, places):
+    """Returns difficulty of every place in places (0 for places without difficulty, same as defaultdict).
+
+    :param difficulties: PriorTable or dict place -> (difficulty, count)
+    :param places: array of place IDs
     """
 
-    first = first_questions(frame.groupby('user'))
-    
-    difficulties = defaultdict(defaultdict_factory)
-    prior_skill  = defaultdict(defaultdict_factory)
+    if isinstance(difficulties, PriorTable):
+        ids, scores = difficulties.ids, difficulties.scores
+    else:
+        ids = array(sorted(difficulties.keys()), dtype=float64)
+        scores = array([difficulties[i][0] for i in ids.tolist()], dtype=float64)
+    if not len(ids):
+        return zeros(len(places), dtype=float64)
+    positions = searchsorted(ids, places)
+    positions[positions == len(ids)] = 0
+    return where(ids[positions] == places, scores[positions], 0.0)
 
-    for index, answer in first.iterrows():
-        update = _elo(answer,
-                    prior_skill[answer.user][0], prior_skill[answer.user][1],
-                    difficulties[answer.place_asked][0], difficulties[answer.place_asked][1])
 
-        prior_skill[answer.user] = (update[0], prior_skill[answer.user][1]+1)
-        difficulties[answer.place_asked] = (update[1], difficulties[answer.place_asked][1]+1)
+def group_codes(frame, by):
+    """Returns (dense group id of every row, position of the first row of every group) for grouping by columns in by.
+    Groups are numbered in sorted order of their keys (same as groupby).
+    """
+
+    codes = zeros(len(frame), dtype=int64)
+    for column in by:
+        uniques, inverse = unique(frame[column].values, return_inverse=True)
+        codes = codes*len(uniques) + inverse
+    uniques, first, codes = unique(codes, return_index=True, return_inverse=True)
+    return (codes, first)
+
+
+def _replay_groups(groups, guess, result, difficulty, skill):
+    """Replays answers of all groups in parallel with fixed difficulties -- n-th answer of every group is one vectorized step.
+    Answers of one group are replayed in their order.
+
+    :param groups: dense group id of every answer
+    :param skill: initial skill of every group, updated in place
+    :returns: number of answers of every group
+    """
+
+    order = argsort(groups, kind='mergesort')
+    counts = bincount(groups, minlength=len(skill) or None) #minlength 0 fails in numpy 1.8
+    rank = zeros(len(groups), dtype=int64)
+    rank[order] = arange(len(groups)) - (cumsum(counts)-counts)[groups[order]] #number of previous answers in the group
+    steps = argsort(rank, kind='mergesort')
+    start = 0
+    for step, end in enumerate(cumsum(bincount(rank)).tolist()):
+        rows = steps[start:end]
+        g = guess[rows]
+        s = skill[groups[rows]]
+        prediction = g + (1-g) * (1.0 / (1 + vexp(-(s-difficulty[rows]))))
+        skill[groups[rows]] = s + 1.0/(1+0.05*step) * (result[rows] - prediction)
+        start = end
+    return counts
+
+
+def estimate_prior_knowledge_batch(frame, difficulties, by=['user']):
+    """Estimates prior knowledge of every group (by default every user) at once. Equivalent to
+    frame.groupby(by).apply(lambda x: estimate_prior_knowledge(x, difficulties)), but groups are replayed in parallel --
+    n-th first question of all groups is one vectorized step.
+
+    :param difficulties: fixed difficulties (PriorTable or dict place -> (difficulty, count))
+    :param by: columns to group by -- default is ['user']
+    :returns: DataFrame with columns skill, count indexed by groups
+    """
+
+    keys = by if 'session_number' in by else by+['session_number']
+    frame = frame[notnull(frame[keys]).all(axis=1).values]
+    groups, first_rows = group_codes(frame, by)
+    sessions = group_codes(frame, ['session_number'])[0]
+    places = group_codes(frame, ['place_asked'])[0]
+    number_of_places = places.max()+1 if len(places) else 1
+
+    order = lexsort((sessions, groups)) #stable -- answers within session keep their order
+    keys = (groups[order]*(sessions.max()+1 if len(sessions) else 1) + sessions[order])*number_of_places + places[order]
+    first = order[sort(unique(keys, return_index=True)[1])]
+
+    groups = groups[first]
+    guess, result = answer_arrays(frame)
+    guess, result = guess[first], result[first]
+    difficulty = difficulty_array(difficulties, frame.place_asked.values[first].astype(float64))
+
+    skill = zeros(len(first_rows), dtype=float64)
+    counts = _replay_groups(groups, guess, result, difficulty, skill)
+
+    if len(by) == 1:
+        index = Index(frame[by[0]].values[first_rows], name=by[0])
+    else:
+        index = MultiIndex.from_arrays([frame[column].values[first_rows] for column in by], names=by)
+    return DataFrame({'skill': skill, 'count': counts}, index=index, columns=['skill', 'count'])
+
+
+class KnowledgeMatrix():
+    def __init__(self, keys, indptr, places, skill, counts, name='user'):
+        """Sparse (CSR) matrix of current skills. Rows are users (or other groups), columns are places.
+        Skills of row i are skill[indptr[i]:indptr[i+1]] for places places[indptr[i]:indptr[i+1]].
+
+        :param keys: sorted row keys (user IDs)
+        :param name: name of row keys -- default is 'user'
+        """
+
+        self.keys = keys
+        self.indptr = indptr
+        self.places = places
+        self.skill = skill
+        self.counts = counts
+        self.name = name
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    @staticmethod
+    def concat(matrices):
+        """Joins matrices with disjoint rows (given in order of their keys) into one.
+        """
+
+        offsets = cumsum([0]+[len(m.places) for m in matrices[:-1]])
+        indptr = concatenate([matrices[0].indptr[:1]]+[m.indptr[1:]+offset for m, offset in zip(matrices, offsets)])
+        return KnowledgeMatrix(concatenate([m.keys for m in matrices]), indptr.astype(int64),
+                               concatenate([m.places for m in matrices]), concatenate([m.skill for m in matrices]),
+                               concatenate([m.counts for m in matrices]), matrices[0].name)
+
+
+    def row(self, key):
+        """Returns current skills of one row as dict place -> (skill, count), same as estimate_current_knowledge.
+        """
+
+        i = searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return {}
+        start, end = self.indptr[i], self.indptr[i+1]
+        return dict(izip(self.places[start:end].tolist(), izip(self.skill[start:end].tolist(), self.counts[start:end].tolist())))
+
+
+    def place_means(self):
+        """Returns mean current skill of every place over all rows.
+        """
+
+        places, inverse = unique(self.places, return_inverse=True)
+        means = bincount(inverse, weights=self.skill)/bincount(inverse)
+        return Series(means, index=Index(places, name='place_asked'))
+
+
+    def to_frame(self):
+        """Returns DataFrame with one row per nonzero element (row key, place, skill, count).
+        """
+
+        rows = self.keys.repeat(self.indptr[1:]-self.indptr[:-1])
+        return DataFrame({self.name: rows, 'place': self.places, 'skill': self.skill, 'count': self.counts},
+                         columns=[self.name, 'place', 'skill', 'count'])
+
+
+def estimate_current_knowledge_batch(frame, difficulties, by='user'):
+    """Estimates current knowledge of every user (or other group) for every place in one pass. Equivalent to calling
+    estimate_current_knowledge for every group -- prior skills come from estimate_prior_knowledge_batch and
+    all (group, place) pairs are replayed in parallel.
+
+    :param difficulties: fixed difficulties (PriorTable or dict place -> (difficulty, count))
+    :param by: column to group by -- default is 'user'
+    :returns: KnowledgeMatrix
+    """
+
+    frame = frame[notnull(frame[[by, 'session_number']]).all(axis=1).values]
+    prior = estimate_prior_knowledge_batch(frame, difficulties, [by])
+    groups = group_codes(frame, [by])[0]
+    places = frame.place_asked.values
+    pairs, first, inverse = unique(pair_keys(groups, places), return_index=True, return_inverse=True)
+
+    guess, result = answer_arrays(frame)
+    skill = prior.skill.values[groups[first]]
+    counts = _replay_groups(inverse, guess, result, difficulty_array(difficulties, places.astype(float64)), skill)
+    indptr = append(0, cumsum(bincount(groups[first], minlength=len(prior) or None))).astype(int64) #minlength 0 fails in numpy 1.8
+    return KnowledgeMatrix(prior.index.values, indptr, places[first], skill, counts, by)
+
+
+class EloState():
+    def __init__(self, place_ids, user_ids):
+        """Array-backed state of elo model. Places and users have dense ids (positions in place_ids/user_ids).
+
+        :param place_ids: sorted array of place IDs
+        :param user_ids: sorted array of user IDs
+        """
+
+        self.place_ids = place_ids
+        self.difficulty = zeros(len(place_ids), dtype=float64)
+        self.place_count = zeros(len(place_ids), dtype=int64)
+        self.user_ids = user_ids
+        self.skill = zeros(len(user_ids), dtype=float64)
+        self.user_count = zeros(len(user_ids), dtype=int64)
+        self.seen = zeros(0, dtype=int64) #sorted (user, place) keys that already had their first answer
+        self.last_id = -1 #high-water mark -- answers up to this id are already in the state
+        self.last_inserted = -1 #inserted of the newest answer in the state (int64 nanoseconds)
+
+
+    def _extend(self, place_ids, user_ids):
+        """Adds new places and users (with zero state), dense ids of the old ones are remapped.
+        """
+
+        place_ids = union1d(self.place_ids, place_ids)
+        user_ids = union1d(self.user_ids, user_ids)
+        positions = searchsorted(place_ids, self.place_ids)
+        self.difficulty, difficulty = zeros(len(place_ids), dtype=float64), self.difficulty
+        self.place_count, place_count = zeros(len(place_ids), dtype=int64), self.place_count
+        self.difficulty[positions] = difficulty
+        self.place_count[positions] = place_count
+        positions = searchsorted(user_ids, self.user_ids)
+        self.skill, skill = zeros(len(user_ids), dtype=float64), self.skill
+        self.user_count, user_count = zeros(len(user_ids), dtype=int64), self.user_count
+        self.skill[positions] = skill
+        self.user_count[positions] = user_count
+        self.place_ids = place_ids
+        self.user_ids = user_ids
+
+
+    def update(self, frame):
+        """Replays only answers newer than the high-water mark (by id). Answer is replayed only if it is the first answer
+        of the place for its user over the whole history, new answers are replayed grouped by user.
+
+        :returns: number of replayed answers
+        """
+
+        ids = answer_ids(frame)
+        new = ids > self.last_id
+        if not new.any():
+            return 0
+        frame = frame[new]
+        ids = ids[new]
+        self._extend(unique(frame.place_asked.values), unique(frame.user.values))
+
+        users = searchsorted(self.user_ids, frame.user.values)
+        places = searchsorted(self.place_ids, frame.place_asked.values)
+        keys = pair_keys(frame.user.values, frame.place_asked.values)
+        inserted = frame.inserted.values.view(int64)
+        guess, result = answer_arrays(frame)
+
+        order = lexsort((inserted, users))
+        first = order[sort(unique(keys[order], return_index=True)[1])]
+        first = first[~_contains(self.seen, keys[first])]
+        self.replay(users[first], places[first], guess[first], result[first])
+
+        self.seen = union1d(self.seen, keys[first])
+        self.last_id = max(self.last_id, int(ids.max()))
+        self.last_inserted = max(self.last_inserted, int(inserted.max()))
+        return len(first)
+
+
+    def replay(self, users, places, guess, result):
+        """Replays answers in given order. Same computation as _elo, but on plain floats without any per-row pandas objects.
+
+        :param users: dense user ids of answers
+        :param places: dense place ids of answers
+        :param guess: probability of guessing the answer (1/number_of_options or 0)
+        :param result: 1.0 for correct answer, 0.0 otherwise
+        """
+
+        skill = self.skill.tolist()
+        user_count = self.user_count.tolist()
+        difficulty = self.difficulty.tolist()
+        place_count = self.place_count.tolist()
+
+        for user, place, g, r in izip(users.tolist(), places.tolist(), guess.tolist(), result.tolist()):
+            s = skill[user]
+            d = difficulty[place]
+            prediction = g + (1-g) * (1.0 / (1 + exp(-(s-d))))
+            skill[user] = s + 1.0/(1+0.05*user_count[user]) * (r - prediction)
+            difficulty[place] = d - 1.0/(1+0.05*place_count[place]) * (r - prediction)
+            user_count[user] += 1
+            place_count[place] += 1
+
+        self.skill = array(skill, dtype=float64)
+        self.user_count = array(user_count, dtype=int64)
+        self.difficulty = array(difficulty, dtype=float64)
+        self.place_count = array(place_count, dtype=int64)
+
+
+    def to_prior(self):
+        """Returns (difficulties, prior_skill) as PriorTables -- used same way as dicts calculate_difficulties always returned.
+        """
+
+        places = self.place_count > 0
+        users = self.user_count > 0
+        return (PriorTable(self.place_ids[places], self.difficulty[places], self.place_count[places]),
+                PriorTable(self.user_ids[users], self.skill[users], self.user_count[users]))
+
+
+class PriorTable(Mapping):
+    def __init__(self, ids, scores, counts):
+        """Read-only dict-like view of difficulties or prior skills backed by arrays (possibly memory-mapped).
+        Maps id -> (score, count), missing ids give (0,0) same as the defaultdicts used before.
+
+        :param ids: sorted array of place/user IDs
+        :param scores: difficulty/skill of every id
+        :param counts: number of answers of every id
+        """
+
+        self.ids = ids
+        self.scores = scores
+        self.counts = counts
+
+
+    def _position(self, key):
+        i = searchsorted(self.ids, key)
+        if i < len(self.ids) and self.ids[i] == key:
+            return i
+        return None
+
+
+    def __getitem__(self, key):
+        i = self._position(key)
+        if i is None:
+            return defaultdict_factory()
+        return (float(self.scores[i]), int(self.counts[i]))
+
+
+    def __contains__(self, key):
+        return self._position(key) is not None
+
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+
+    def iteritems(self):
+        return izip(self.ids.tolist(), izip(self.scores.tolist(), self.counts.tolist()))
+
+
+    def itervalues(self):
+        return izip(self.scores.tolist(), self.counts.tolist())
+
+
+    def items(self):
+        return list(self.iteritems())
+
+
+    def values(self):
+        return list(self.itervalues())
+
+
+def _contains(sorted_values, values):
+    positions = searchsorted(sorted_values, values)
+    positions[positions == len(sorted_values)] = 0
+    return (sorted_values[positions] == values) if len(sorted_values) else zeros(len(values), dtype=bool)
+
+
+def pair_keys(users, places):
+    """Returns one int64 key for every (user, place) pair -- place_asked is uint16.
+    """
+
+    return users.astype(int64)*2**16 + places.astype(int64)
+
+
+def answer_ids(frame):
+    """Returns answer ids of frame (index 'id', also when it is level of MultiIndex after groupby-apply).
+    """
+
+    if isinstance(frame.index, MultiIndex):
+        return frame.index.get_level_values('id').values
+    return frame.index.values
+
+
+def answer_arrays(frame):
+    """Returns (guess, result) arrays used by EloState.replay.
+    """
+
+    options = frame.number_of_options.values.astype(float64)
+    guess = zeros(len(options), dtype=float64)
+    guess[options != 0] = 1.0/options[options != 0]
+    result = (frame.place_asked.values == frame.place_answered.values).astype(float64)
+    return (guess, result)
+
+
+def first_answers_by_user(users, places):
+    """Returns positions of first answers of every place for every user, in order of answers grouped by user.
+    Same rows (and order) as first_questions(frame.groupby('user')).
+
+    :param users: dense user ids
+    :param places: dense place ids
+    """
+
+    order = argsort(users, kind='mergesort')
+    keys = users[order].astype(int64)*(places.max()+1 if len(places) else 1) + places[order]
+    first = unique(keys, return_index=True)[1]
+    return order[sort(first)]
+
+
+def calculate_elo_state(frame):
+    """Calculates whole elo state (see EloState) from all answers of frame.
+    """
+
+    user_ids, users = unique(frame.user.values, return_inverse=True)
+    place_ids, places = unique(frame.place_asked.values, return_inverse=True)
+    guess, result = answer_arrays(frame)
+    first = first_answers_by_user(users, places)
+
+    state = EloState(place_ids, user_ids)
+    state.replay(users[first], places[first], guess[first], result[first])
+    state.seen = unique(pair_keys(frame.user.values[first], frame.place_asked.values[first]))
+    if len(frame):
+        state.last_id = int(answer_ids(frame).max())
+        state.last_inserted = int(frame.inserted.values.view(int64).max())
+    return state
+
+
+def calculate_difficulties(frame):
+    """Calculates difficulty for every country
+    """
 
-    return (difficulties, prior_skill)
+    return calculate_elo_state(frame).to_prior()
 
 
 def estimate_current_knowledge(frame, difficulties):
@@ -82,7 +82,7 @@ class Graph(Drawable):
         """
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.average_skill(self.frame,self.prior[0],self.codes,threshold)
+        data = analysis_per_session.average_skill(self.get_place_types(),self.prior[0],self.codes,threshold, processes=self.processes)
         data.result = data.result.map(logis)
         if not data.empty:
             data = data.reset_index()
@@ -100,7 +100,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.average_skill(self.frame,self.prior[0],self.codes, threshold)
+        data = analysis_per_session.average_skill(self.get_place_types(),self.prior[0],self.codes, threshold, processes=self.processes)
         data.result = data.result.map(logis)
         if not data.empty:
             fig, ax = plt.subplots()
@@ -126,7 +126,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.average_skill(self.frame, self.prior[0], self.codes,threshold, grpby = ['session_number'])
+        data = analysis_per_session.average_skill(self.get_place_types(), self.prior[0], self.codes,threshold, grpby = ['session_number'], processes=self.processes)
         data.result = data.result.map(logis)
         if not data.empty:
             fig, ax = plt.subplots()
@@ -149,7 +149,7 @@ class Graph(Drawable):
         """
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = data = analysis_per_session.average_success(self.frame,self.codes,threshold)
+        data = data = analysis_per_session.average_success(self.get_place_types(),self.codes,threshold)
         data.result = data.result.map(logis)
         if not data.empty:
             data = data.reset_index()
@@ -168,7 +168,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.average_success(self.frame,self.codes,threshold)
+        data = analysis_per_session.average_success(self.get_place_types(),self.codes,threshold)
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -193,7 +193,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.average_success(self.frame,self.codes,threshold, grpby= ['session_number'])  
+        data = analysis_per_session.average_success(self.get_place_types(),self.codes,threshold, grpby= ['session_number'])  
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -217,7 +217,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.lengths_of_sessions(self.frame, threshold)
+        data = analysis_per_session.lengths_of_sessions(self.frame, threshold, self.get_sessions())
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -241,7 +241,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.number_of_answers(self.frame,threshold)
+        data = analysis_per_session.number_of_answers(self.frame,threshold, self.get_sessions())
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -265,7 +265,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.number_of_users(self.frame)
+        data = analysis_per_session.number_of_users(self.frame, self.get_sessions())
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -289,7 +289,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_time.weekday_activity(self.frame)
+        data = self.get_activity().weekday_activity()
         if not data.empty:
             ind = arange(7)
             width = 0.4
@@ -313,7 +313,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_time.hourly_activity(self.frame)
+        data = self.get_activity().hourly_activity()
         if not data.empty:
             ind = arange(24)
             width = 0.4
@@ -426,7 +426,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_assorted.answer_portions(self.frame, threshold)
+        data = self.get_confusion().answer_portions(self.places[0], threshold)
 
         if not data.empty:
             fig, ax = plt.subplots()
@@ -519,7 +519,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_assorted.average_over_items(self.frame, analysis_assorted.success_over_items)
+        data = analysis_assorted.average_over_items(self.get_items(), analysis_assorted.success_over_items)
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -541,7 +541,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_assorted.average_over_items(self.frame, lambda x: analysis_assorted.current_knowledge_over_items(x, self.prior[0]))
+        data = analysis_assorted.average_over_items(self.get_items(), lambda x, by: analysis_assorted.current_knowledge_over_items(x, self.prior[0], by))
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -563,7 +563,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_assorted.average_over_items(self.frame, analysis_assorted.response_time_over_items)
+        data = analysis_assorted.average_over_items(self.get_items(), analysis_assorted.response_time_over_items)
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -585,7 +585,7 @@ class Graph(Drawable):
 
         if not directory:
             directory = self.current_directory+'/graphs/'
-        data = analysis_per_session.response_time_start_end(self.frame)
+        data = analysis_per_session.response_time_start_end(self.frame, sessions=self.get_sessions())
         if not data.empty:
             fig, ax = plt.subplots()
 
@@ -600,4 +600,27 @@ class Graph(Drawable):
             ax.set_title(u"Difference in response times between start and the end of the session [ms]")
 
             plt.savefig(directory+'response_time_start_end.svg', bbox_inches='tight')
+            plt.close()
+
+
+    def response_time_start_end_samples(self, directory='', samples=[1,3,5,10]):
+        """Draws mean differences between response times at start and the end of sessions for several sample sizes
+
+        :param directory: output directory -- default is '' (current_directory)
+        :param samples: numbers of answers at start and end of session to compare
+        """
+
+        if not directory:
+            directory = self.current_directory+'/graphs/'
+        data = analysis_per_session.response_time_start_end(self.frame, sample=samples)
+        if not data.empty:
+            fig, ax = plt.subplots()
+
+            for sample, colour in zip(samples, colour_range(len(samples), 0.8)):
+                ax.plot(data.index, data[sample], color=colour, label=str(sample)+' answers')
+            ax.legend()
+            ax.set_title(u"Difference in response times between start and the end of the session [ms]")
+            ax.set_xlabel(u"Session number")
+
+            plt.savefig(directory+'response_time_start_end_samples.svg', bbox_inches='tight')
             plt.close()
\ No newline at end of file
@@ -1,17 +1,229 @@
 # -*- coding: utf-8 -*-
 
-from elo_rating_system import calculate_difficulties
-from common import add_session_numbers, defaultdict_factory
+from elo_rating_system import calculate_elo_state, estimate_current_knowledge_batch, answer_ids, EloState, PriorTable, KnowledgeMatrix
+from answer_store import AnswerStore, build_answer_store, decode_column
+from activity import ActivityCube
+from confusion import ConfusionMatrix, build_confusion_matrix
+from common import add_session_numbers_by_user, defaultdict_factory
+from memo import enable as enable_memo, fingerprint as memo_fingerprint
+from parallel import estimate_current_knowledge_parallel
 
-from numpy import uint32,uint16,uint8,float16
-from pandas import read_csv, unique
+from numpy import uint32,uint16,uint8,float16,int32,int64,float64,dtype,array,save,fromfile,memmap
+from numpy import load as load_array
+from numpy.lib.format import open_memmap
+from pandas import read_csv, unique, factorize, DataFrame, Index
 from yaml import dump,load
 from argparse import ArgumentParser
-from os import path
+from os import path, makedirs, rename, remove, stat
+from shutil import rmtree
+from hashlib import md5
+from collections import OrderedDict
+from struct import Struct
+from warnings import warn
 
 
-def load_answer_csv(path, types = {'user':uint32,'id':uint32,'place_asked':uint16,'place_answered':float16,'type':uint8,'response_time':uint32,'number_of_options':uint8,'place_map':float16,'ip_address':object}
-):
+CACHE_VERSION = 1
+ANSWER_TYPES = {'user':uint32,'id':uint32,'place_asked':uint16,'place_answered':float16,'type':uint8,'response_time':uint32,'number_of_options':uint8,'place_map':float16,'ip_address':object}
+
+
+def _file_fingerprint(source):
+    """Returns size and mtime of a file -- cheap part of the cache key.
+    """
+
+    info = stat(source)
+    return {'size': info.st_size, 'mtime': info.st_mtime}
+
+
+def _content_hash(source, block_size=2**20):
+    """Returns md5 hexdigest of file content, read in blocks of block_size bytes.
+    """
+
+    digest = md5()
+    with open(source, 'rb') as f:
+        block = f.read(block_size)
+        while block:
+            digest.update(block)
+            block = f.read(block_size)
+    return digest.hexdigest()
+
+
+def _dtype_names(types):
+    return dict((str(column), dtype(t).str) for column, t in types.items())
+
+
+def _encode_column(values, labels):
+    """Converts one column into typed numpy array. Datetimes are stored as int64 nanoseconds, objects as int32 codes
+    into list of labels (missing values have code -1).
+
+    :param labels: OrderedDict label -> code, new labels are added into it (so codes stay same across chunks)
+    :returns: (encoded values, kind of column -- 'datetime'/'object'/'plain')
+    """
+
+    if values.dtype.kind == 'M':
+        return (values.view(int64), 'datetime')
+    elif values.dtype.kind == 'O':
+        codes, uniques = factorize(values)
+        translation = array([labels.setdefault(label, len(labels)) for label in uniques]+[-1], dtype=int32)
+        return (translation.take(codes), 'object') #code -1 takes the last element, which is -1
+    return (values, 'plain')
+
+
+class _CacheWriter():
+    def __init__(self, directory):
+        """Writes columnar cache chunk by chunk into temporary directory. Nothing is visible in directory until close.
+
+        :param directory: cache directory
+        """
+
+        self.directory = directory
+        self.temp = directory+'.tmp'
+        if path.exists(self.temp):
+            rmtree(self.temp)
+        makedirs(self.temp)
+        self.columns = None
+        self.kinds = {}
+        self.dtypes = {}
+        self.labels = {}
+        self.files = {}
+        self.length = 0
+
+
+    def append(self, frame):
+        if self.columns is None:
+            self.columns = [str(column) for column in frame.columns]
+        for name, values in zip(self.columns+['id'], [frame[column].values for column in frame.columns]+[frame.index.values]):
+            values, kind = _encode_column(values, self.labels.setdefault(name, OrderedDict()))
+            if name not in self.files:
+                self.files[name] = open(self.temp+'/'+name+'.raw', 'wb')
+                self.kinds[name] = kind
+                self.dtypes[name] = values.dtype
+            values.astype(self.dtypes[name]).tofile(self.files[name])
+        self.length += len(frame)
+
+
+    def close(self, fingerprint, types, block_size=2**20):
+        """Converts raw columns into .npy files (copied in blocks of block_size values), writes meta.yaml
+        and moves the cache into place.
+        """
+
+        for name, raw in self.files.items():
+            raw.close()
+            if self.length:
+                out = open_memmap(self.temp+'/'+name+'.npy', mode='w+', dtype=self.dtypes[name], shape=(self.length,))
+                with open(self.temp+'/'+name+'.raw', 'rb') as data:
+                    for start in xrange(0, self.length, block_size):
+                        values = fromfile(data, dtype=self.dtypes[name], count=block_size)
+                        out[start:start+len(values)] = values
+                out.flush()
+                del out
+            else:
+                save(self.temp+'/'+name+'.npy', array([], dtype=self.dtypes[name]))
+            remove(self.temp+'/'+name+'.raw')
+            if self.kinds[name] == 'object':
+                save(self.temp+'/'+name+'.labels.npy', array(list(self.labels[name].keys())))
+
+        columns = self.columns or []
+        meta = {'version': CACHE_VERSION, 'fingerprint': fingerprint, 'types': _dtype_names(types),
+                'columns': columns, 'kinds': dict((name, self.kinds[name]) for name in columns), 'length': self.length}
+        with open(self.temp+'/meta.yaml', 'w') as out:
+            dump(meta, out)
+
+        if path.exists(self.directory):
+            rmtree(self.directory)
+        rename(self.temp, self.directory)
+
+
+def _load_column(directory, name, kind, mmap_mode=None):
+    values = load_array(directory+'/'+name+'.npy', mmap_mode=mmap_mode)
+    labels = load_array(directory+'/'+name+'.labels.npy') if kind == 'object' else None
+    return decode_column(values, kind, labels)
+
+
+def save_answer_cache(frame, directory, fingerprint, types):
+    """Saves answer DataFrame as columnar cache -- one typed numpy array per column and meta.yaml with the key.
+    The cache is written into temporary directory first and then renamed, so it is never left half-written.
+
+    :param frame: DataFrame loaded by load_answer_csv
+    :param directory: cache directory
+    :param fingerprint: dict with size, mtime and md5 of the source csv
+    :param types: dtypes used for loading the source csv
+    """
+
+    writer = _CacheWriter(directory)
+    writer.append(frame)
+    writer.close(fingerprint, types)
+
+
+def build_answer_cache(path, types = ANSWER_TYPES, chunksize=1000000):
+    """Streams answer csv into columnar cache chunk by chunk, so the csv never has to fit into memory.
+
+    :param path: load csv from this path
+    :param chunksize: number of rows read at once
+    """
+
+    fingerprint = _file_fingerprint(path)
+    fingerprint['md5'] = _content_hash(path)
+    writer = _CacheWriter(path+'.cache')
+    for chunk in read_csv(path, sep=',',parse_dates=[5],dtype=types,index_col='id',chunksize=chunksize):
+        writer.append(chunk)
+    writer.close(fingerprint, types)
+
+
+def load_answer_cache(directory, mmap_mode=None):
+    """Loads answer DataFrame from columnar cache made by save_answer_cache.
+
+    :param directory: cache directory
+    :param mmap_mode: passed to numpy.load -- default is None (read columns into memory)
+    """
+
+    meta = load_cache_meta(directory)
+    columns = OrderedDict()
+    for column in meta['columns']:
+        columns[column] = _load_column(directory, column, meta['kinds'][column], mmap_mode)
+    index = Index(_load_column(directory, 'id', 'plain', mmap_mode), name='id')
+    return DataFrame(columns, index=index, columns=meta['columns'])
+
+
+def load_cache_meta(directory):
+    """Returns meta information of columnar cache or None if there is no usable cache.
+    """
+
+    if not path.exists(directory+'/meta.yaml'):
+        return None
+    with open(directory+'/meta.yaml') as meta:
+        meta = load(meta)
+    if not isinstance(meta, dict) or meta.get('version') != CACHE_VERSION:
+        return None
+    return meta
+
+
+def is_cache_valid(source, directory, types):
+    """Checks whether columnar cache in directory belongs to source csv.
+    Size and mtime are compared first. If only mtime differs, content hash decides (and the cached mtime is refreshed).
+
+    :param source: path to the csv
+    :param directory: cache directory
+    :param types: dtypes used for loading the csv
+    """
+
+    meta = load_cache_meta(directory)
+    if meta is None or meta['types'] != _dtype_names(types):
+        return False
+    current = _file_fingerprint(source)
+    cached = meta['fingerprint']
+    if current['size'] != cached['size']:
+        return False
+    if current['mtime'] == cached['mtime']:
+        return True
+    if _content_hash(source) != cached['md5']:
+        return False
+    meta['fingerprint']['mtime'] = current['mtime']
+    with open(directory+'/meta.yaml', 'w') as out:
+        dump(meta, out)
+    return True
+
+
+def load_answer_csv(path, types = ANSWER_TYPES, cache=True):
     """Imports answer csv into pandas DataFrame
 
     default dtypes:
@@ -25,14 +237,61 @@ def load_answer_csv(path, types = {'user':uint32,'id':uint32,'place_asked':uint1
     - 'number_of_options':uint8
     - 'place_map':float16 -- has to be float, because uint does not understand NaN (which place_map may contain)
     - 'ip_address':object
+
+    Parsed csv is stored in columnar cache (directory path+'.cache') and later runs load it from there.
+    Cache is rebuilt whenever size or content of the csv changes.
     
     :param path: load csv from this path
+    :param cache: whether to use columnar cache -- default is True
     """
 
+    directory = path+'.cache'
+    if cache and is_cache_valid(path, directory, types):
+        try:
+            return load_answer_cache(directory)
+        except Exception: #unreadable cache is a cache miss, it is rebuilt below
+            warn('columnar cache of '+path+' could not be loaded, rebuilding it')
+
     df = read_csv(path, sep=',',parse_dates=[5],dtype=types,index_col='id')
+    if cache:
+        fingerprint = _file_fingerprint(path)
+        fingerprint['md5'] = _content_hash(path)
+        save_answer_cache(df, directory, fingerprint, types)
     return df
 
 
+def load_answer_store(path, types = ANSWER_TYPES, chunksize=1000000):
+    """Returns memory-mapped AnswerStore of answer csv. Store lives inside of the columnar cache, so it is rebuilt together with it.
+    Neither the cache nor the store needs the whole csv in memory.
+
+    :param path: load csv from this path
+    :param chunksize: number of rows read at once when (re)building the cache
+    """
+
+    directory = path+'.cache'
+    if is_cache_valid(path, directory, types):
+        try:
+            if not AnswerStore.exists(directory+'/store'):
+                build_answer_store(directory, load_cache_meta(directory), chunksize)
+            return AnswerStore(directory+'/store')
+        except Exception: #unreadable cache is a cache miss, it is rebuilt below
+            warn('columnar cache of '+path+' could not be loaded, rebuilding it')
+    build_answer_cache(path, types, chunksize)
+    build_answer_store(directory, load_cache_meta(directory), chunksize)
+    return AnswerStore(directory+'/store')
+
+
+def iter_answer_chunks(path, chunksize=1000000):
+    """Yields answers from csv in chunks of about chunksize rows, every chunk holds whole history of its users.
+    Used by streaming module.
+
+    :param path: load csv from this path
+    :param chunksize: number of rows in one chunk
+    """
+
+    return load_answer_store(path, chunksize=chunksize).iter_chunks(chunksize)
+
+
 def load_place_csv(path, types = {'id':uint32,'code':object,'name':object,'type':uint8}):
     """Used for importing csv of places
     
@@ -61,36 +320,348 @@ def load_ab_csv(path):
     return result
 
 
-def save_prior(out, path):
-    """Calculates and saves difficulties of countries into json file.
+PRIOR_MAGIC = 'SLPRIOR\0'
+PRIOR_VERSION = 1
+PRIOR_HEADER = Struct('<8sI32sqqqqq') #magic, version, dataset fingerprint, places, users, seen pairs, last id, last inserted
+PRIOR_HEADER_SIZE = 128
+PRIOR_ARRAYS = [('place_ids', int64, 'places'), ('difficulty', float64, 'places'), ('place_count', int64, 'places'),
+                ('user_ids', int64, 'users'), ('skill', float64, 'users'), ('user_count', int64, 'users'),
+                ('seen', int64, 'seen')]
+
+
+def save_prior(state, path, fingerprint=''):
+    """Saves whole elo state (see elo_rating_system.EloState) into binary prior file.
+    File has fixed-size header (version, dataset fingerprint, lengths, high-water mark) followed by dense arrays.
+    The file is written to path+'.tmp' first and renamed over path.
+
+    :param state: EloState
+    :param path: save to this path
+    :param fingerprint: md5 of answers the state was calculated from
+    """
+
+    with open(path+'.tmp', 'wb') as out:
+        header = PRIOR_HEADER.pack(PRIOR_MAGIC, PRIOR_VERSION, str(fingerprint), len(state.place_ids), len(state.user_ids),
+                                   len(state.seen), state.last_id, state.last_inserted)
+        out.write(header+'\0'*(PRIOR_HEADER_SIZE-len(header)))
+        for name, kind, length in PRIOR_ARRAYS:
+            getattr(state, name).astype(kind).tofile(out)
+    rename(path+'.tmp', path)
+
+
+def read_prior_header(path):
+    """Returns header of binary prior file as dict.
+    """
+
+    with open(path, 'rb') as f:
+        magic, version, fingerprint, places, users, seen, last_id, last_inserted = PRIOR_HEADER.unpack(f.read(PRIOR_HEADER.size))
+    if magic != PRIOR_MAGIC or version != PRIOR_VERSION:
+        raise ValueError(path+' is not a prior file of version '+str(PRIOR_VERSION))
+    return {'fingerprint': fingerprint.rstrip('\0'), 'places': places, 'users': users, 'seen': seen,
+            'last_id': last_id, 'last_inserted': last_inserted}
+
+
+def _read_prior_arrays(path, header, mode):
+    """Returns dict of arrays of binary prior file -- memory-mapped when mode is 'r', read into memory when mode is None.
+    """
+
+    arrays = {}
+    offset = PRIOR_HEADER_SIZE
+    for name, kind, length in PRIOR_ARRAYS:
+        length = header[length]
+        if mode is None or not length:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                arrays[name] = fromfile(f, dtype=kind, count=length)
+        else:
+            arrays[name] = memmap(path, dtype=kind, mode=mode, offset=offset, shape=(length,))
+        offset += length*dtype(kind).itemsize
+    return arrays
+
+
+def load_prior(path, mmap=True):
+    """Returns difficulties and prior_skills (PriorTables behaving as dicts id -> (score, count)) from binary prior file.
+
+    :param path: load from this path
+    :param mmap: whether to memory-map the arrays -- default is True
+    """
+
+    arrays = _read_prior_arrays(path, read_prior_header(path), 'r' if mmap else None)
+    return (PriorTable(arrays['place_ids'], arrays['difficulty'], arrays['place_count']),
+            PriorTable(arrays['user_ids'], arrays['skill'], arrays['user_count']))
+
+
+def load_elo_state(path):
+    """Returns EloState (with its high-water mark) loaded from binary prior file.
+
+    :param path: load from this path
+    """
 
-    :param frame: calculate from this frame
+    header = read_prior_header(path)
+    arrays = _read_prior_arrays(path, header, None)
+    state = EloState(arrays['place_ids'], arrays['user_ids'])
+    for name, kind, length in PRIOR_ARRAYS:
+        setattr(state, name, arrays[name])
+    state.last_id = header['last_id']
+    state.last_inserted = header['last_inserted']
+    return state
+
+
+def export_prior_yaml(prior, path):
+    """Exports difficulties and prior_skills into yaml file (as tuple of dicts id -> (score, count)).
+
+    :param prior: (difficulties, prior_skill)
     :param path: save to this path
     """
 
     with open(path,'w') as diff:
-        dump(out,diff)
+        dump((dict(prior[0]), dict(prior[1])),diff)
 
 
-def load_prior(path):
-    """Returns difficulties and prior_skills of places by loading yaml file
+def import_prior_yaml(path):
+    """Returns EloState made from yaml prior (as exported by export_prior_yaml or saved by older versions).
+    Yaml prior has no high-water mark, so updating it replays whole history.
 
     :param path: load yaml from this path
     """
 
     with open(path) as diff:
-        return load(diff)
+        prior = load(diff)
+    tables = []
+    for table in prior:
+        ids = sorted(table.keys())
+        tables.append((array(ids, dtype=int64), array([table[i][0] for i in ids], dtype=float64),
+                       array([table[i][1] for i in ids], dtype=int64)))
+    state = EloState(tables[0][0], tables[1][0])
+    state.difficulty, state.place_count = tables[0][1:]
+    state.skill, state.user_count = tables[1][1:]
+    return state
+
+
+def dataset_fingerprint(path):
+    """Returns md5 of answer csv (taken from its columnar cache when there is one).
+    """
+
+    meta = load_cache_meta(path+'.cache')
+    if meta is None:
+        return _content_hash(path)
+    return meta['fingerprint']['md5']
+
+
+def update_prior(frame, directory, fingerprint=''):
+    """Updates elo state in directory+'/prior.bin' with answers newer than its high-water mark.
+    Without a prior file, the whole history is replayed and a new one is created.
+
+    :param frame: all answers (at least all answers newer than the prior file)
+    :param directory: data directory
+    :param fingerprint: md5 of answers, stored in the prior file
+    :returns: (difficulties, prior_skill)
+    """
+
+    state = load_elo_state(directory+'/prior.bin') if path.exists(directory+'/prior.bin') else None
+    if state is not None and state.last_id >= 0:
+        state.update(frame)
+    else:
+        state = calculate_elo_state(add_session_numbers_by_user(frame))
+    save_prior(state, directory+'/prior.bin', fingerprint)
+    return state.to_prior()
+
+
+def _save_arrays(directory, arrays, meta):
+    """Saves numpy arrays (dict name -> array) as name.npy and meta (dict) as meta.yaml into directory. Files are
+    written into directory+'.tmp' which then replaces directory, so readers never see a half-written directory.
+    """
+
+    temp = directory+'.tmp'
+    if path.exists(temp):
+        rmtree(temp)
+    makedirs(temp)
+    for name, values in arrays.items():
+        save(temp+'/'+name+'.npy', values)
+    with open(temp+'/meta.yaml', 'w') as out:
+        dump(meta, out)
+    if path.exists(directory):
+        rmtree(directory)
+    rename(temp, directory)
+
+
+def _load_meta(directory, fingerprint=None):
+    """Returns meta of directory saved by _save_arrays, None if there is none or its fingerprint differs.
+
+    :param fingerprint: expected fingerprint -- default is None (do not check)
+    """
+
+    if not path.exists(directory+'/meta.yaml'):
+        return None
+    with open(directory+'/meta.yaml') as meta:
+        meta = load(meta)
+    if fingerprint is not None and meta.get('fingerprint') != fingerprint:
+        return None
+    return meta
+
+
+def _load_arrays(directory, names, mmap_mode=None):
+    """Returns list of arrays of names saved by _save_arrays.
+    """
+
+    return [load_array(directory+'/'+name+'.npy', mmap_mode=mmap_mode) for name in names]
+
+
+KNOWLEDGE_ARRAYS = ['keys', 'indptr', 'places', 'skill', 'counts']
+
+
+def save_knowledge_matrix(matrix, directory, fingerprint=''):
+    """Saves KnowledgeMatrix (see elo_rating_system.estimate_current_knowledge_batch) as numpy arrays into directory.
+
+    :param matrix: KnowledgeMatrix
+    :param directory: save into this directory
+    :param fingerprint: identifies answers and difficulties the matrix was estimated from
+    """
+
+    _save_arrays(directory, dict((name, getattr(matrix, name)) for name in KNOWLEDGE_ARRAYS),
+                 {'name': matrix.name, 'fingerprint': fingerprint})
+
+
+def load_knowledge_matrix(directory, mmap=True, fingerprint=None):
+    """Returns KnowledgeMatrix saved by save_knowledge_matrix, None if there is none or it was estimated from other
+    answers or difficulties.
+
+    :param directory: load from this directory
+    :param mmap: whether to memory-map the arrays -- default is True
+    :param fingerprint: fingerprint of answers and difficulties -- default is None (do not check)
+    """
 
-def get_arguments(directory, require_items=True):
+    meta = _load_meta(directory, fingerprint)
+    if meta is None:
+        return None
+    return KnowledgeMatrix(*_load_arrays(directory, KNOWLEDGE_ARRAYS, 'r' if mmap else None), name=meta['name'])
+
+
+def get_knowledge_matrix(frame, difficulties, directory, fingerprint='', processes=None):
+    """Returns KnowledgeMatrix of users from directory+'/knowledge', it is estimated from frame and saved when it is
+    missing or estimated from other answers or difficulties.
+
+    :param frame: first answers of sessions (see common.session_first_questions)
+    :param difficulties: fixed difficulties (PriorTable)
+    :param directory: data directory
+    :param fingerprint: md5 of answers (see dataset_fingerprint)
+    :param processes: estimate skills in this many processes (see parallel module) -- default is None (serially)
+    """
+
+    key = memo_fingerprint([fingerprint, difficulties])
+    matrix = load_knowledge_matrix(directory+'/knowledge', fingerprint=key)
+    if matrix is None:
+        if processes is not None:
+            matrix = estimate_current_knowledge_parallel(frame, difficulties, processes)
+        else:
+            matrix = estimate_current_knowledge_batch(frame, difficulties)
+        save_knowledge_matrix(matrix, directory+'/knowledge', key)
+    return matrix
+
+
+ACTIVITY_ARRAYS = ['counts', 'correct']
+
+
+def save_activity_cube(cube, directory, fingerprint=''):
+    """Saves ActivityCube as numpy arrays into directory.
+
+    :param cube: ActivityCube
+    :param directory: save into this directory
+    :param fingerprint: md5 of answers the cube was built from
+    """
+
+    _save_arrays(directory, dict((name, getattr(cube, name)) for name in ACTIVITY_ARRAYS),
+                 {'first_day': cube.first_day, 'last_id': cube.last_id, 'fingerprint': fingerprint})
+
+
+def load_activity_cube(directory):
+    """Returns ActivityCube saved by save_activity_cube, None if there is none.
+
+    :param directory: load from this directory
+    """
+
+    meta = _load_meta(directory)
+    if meta is None:
+        return None
+    return ActivityCube(meta['first_day'], *_load_arrays(directory, ACTIVITY_ARRAYS), last_id=meta['last_id'])
+
+
+def update_activity_cube(frame, directory, fingerprint=''):
+    """Adds answers newer than the high-water mark of cube in directory+'/activity' and saves it.
+    Without a saved cube, or when the saved cube was built from other answers and frame does not only append
+    to them (see ActivityCube.is_prefix_of), a new one is built from all answers.
+
+    :param frame: all answers
+    :param directory: data directory
+    :param fingerprint: md5 of answers (see dataset_fingerprint)
+    :returns: ActivityCube
+    """
+
+    saved = (_load_meta(directory+'/activity') or {}).get('fingerprint')
+    cube = load_activity_cube(directory+'/activity')
+    if cube is None or (saved != fingerprint and not cube.is_prefix_of(frame)):
+        cube = ActivityCube()
+    if cube.update(frame) or saved != fingerprint:
+        save_activity_cube(cube, directory+'/activity', fingerprint)
+    return cube
+
+
+CONFUSION_ARRAYS = ['asked', 'indptr', 'answered', 'counts', 'first_counts', 'totals', 'first_totals']
+
+
+def save_confusion_matrix(matrix, directory, fingerprint=''):
+    """Saves ConfusionMatrix as numpy arrays into directory.
+
+    :param matrix: ConfusionMatrix
+    :param directory: save into this directory
+    :param fingerprint: md5 of answers the matrix was built from
+    """
+
+    _save_arrays(directory, dict((name, getattr(matrix, name)) for name in CONFUSION_ARRAYS), {'fingerprint': fingerprint})
+
+
+def load_confusion_matrix(directory, fingerprint=None):
+    """Returns ConfusionMatrix saved by save_confusion_matrix, None if there is none or it was built from other answers.
+
+    :param directory: load from this directory
+    :param fingerprint: md5 of answers -- default is None (do not check)
+    """
+
+    if _load_meta(directory, fingerprint) is None:
+        return None
+    return ConfusionMatrix(*_load_arrays(directory, CONFUSION_ARRAYS))
+
+
+def get_confusion_matrix(frame, directory, fingerprint=''):
+    """Returns ConfusionMatrix from directory+'/confusion', it is built from frame and saved when it is missing
+    or built from other answers.
+
+    :param frame: all answers (DataFrame or AnswerStore)
+    :param directory: data directory
+    :param fingerprint: md5 of answers (see dataset_fingerprint)
+    """
+
+    matrix = load_confusion_matrix(directory+'/confusion', fingerprint)
+    if matrix is None:
+        matrix = build_confusion_matrix(frame)
+        save_confusion_matrix(matrix, directory+'/confusion', fingerprint)
+    return matrix
+
+
+def get_arguments(directory, require_items=True, use_store=False):
     """Parses arguments from command line (-f for directory and -i for items) and returns them as tuple.
     
     :param directory: load from this directory as default (if -f is not specified)
     :param require_items: whether to is item argument required
-    :returns: (items, frame, prior, codes, working_directory)
+    :param use_store: return memory-mapped AnswerStore instead of DataFrame as frame -- default is False
+    :returns: (items, frame, prior, codes, working_directory) -- frame is AnswerStore also with -s (stream)
     """
 
     parser = ArgumentParser()
-    parser.add_argument('-f', '--file', metavar = 'FILE', help='Optional path to directory with geography-answer.csv and prior.yaml')
+    parser.add_argument('-f', '--file', metavar = 'FILE', help='Optional path to directory with geography-answer.csv and prior.bin')
+    parser.add_argument('-u', '--update', action='store_true', help='Update prior.bin with answers newer than it instead of loading it (done without -u when answers were only added)')
+    parser.add_argument('-y', '--export-yaml', action='store_true', help='Export prior into prior.yaml')
+    parser.add_argument('-m', '--memo', action='store_true', help='Memoize analysis results in data/memo for later runs')
+    parser.add_argument('-s', '--stream', action='store_true', help='Evaluate global analyses chunk by chunk from memory-mapped answers instead of loading them all (see streaming module)')
     if require_items:
         parser.add_argument('-i', '--items', required=True, metavar = 'ITEMS',nargs='+', help='id of an item to filter')
     args = parser.parse_args()
@@ -100,15 +671,31 @@ def get_arguments(directory, require_items=True):
     else:
         working_directory = args.file
     
-    frame = load_answer_csv(working_directory+"/data/geography.answer.csv")
+    answers = working_directory+"/data/geography.answer.csv"
+    if use_store or args.stream:
+        frame = load_answer_store(answers)
+    else:
+        frame = load_answer_csv(answers)
     codes = load_place_csv(working_directory+'/data/geography.place.csv')
-
-    if path.exists(working_directory+'/data/prior.yaml'):
-        prior = load_prior(working_directory+'/data/prior.yaml')
+    fingerprint = dataset_fingerprint(answers)
+    if args.memo:
+        enable_memo(working_directory+'/data/memo', namespace=fingerprint)
+    if not path.exists(working_directory+'/data/prior.bin') and path.exists(working_directory+'/data/prior.yaml'):
+        save_prior(import_prior_yaml(working_directory+'/data/prior.yaml'), working_directory+'/data/prior.bin', fingerprint)
+    update = args.update or not path.exists(working_directory+'/data/prior.bin')
+    if not update:
+        header = read_prior_header(working_directory+'/data/prior.bin')
+        if header['fingerprint'] != fingerprint:
+            ids = frame.ids() if isinstance(frame, AnswerStore) else answer_ids(frame)
+            update = header['last_id'] >= 0 and len(ids) > 0 and ids.max() > header['last_id'] #answers have grown
+            if not update:
+                warn('prior.bin was calculated from different answers, run with -u to update it')
+    if not update:
+        prior = load_prior(working_directory+'/data/prior.bin')
     else:
-        frame = frame.groupby('user').apply(add_session_numbers)
-        prior = calculate_difficulties(frame)
-        save_prior(prior,working_directory+'/data/prior.yaml')
+        prior = update_prior(frame.frame() if isinstance(frame, AnswerStore) else frame, working_directory+'/data', fingerprint)
+    if args.export_yaml:
+        export_prior_yaml(prior, working_directory+'/data/prior.yaml')
     
     if require_items:
         return (args.items, frame, prior, codes, working_directory)
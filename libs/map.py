@@ -180,7 +180,7 @@ class Map(Drawable):
 
         if not directory:
             directory = self.current_directory+'/maps/'
-        data = analysis_per_place.mistaken_places(self.frame)
+        data = self.get_confusion().mistaken_places(self.places[0])
         if not (data[0].empty or self.places[0] is None):
             self.draw_map(data[0], directory+'mistaken_places.svg', 
             'Places mistaken for '+self.get_country_name(self.places[0])+' out of '+str(data[1])+' answers',
@@ -196,22 +196,29 @@ class Map(Drawable):
 
         if not directory:
             directory = self.current_directory+'/maps/'
-        data = analysis_per_place.number_of_answers(self.frame)
+        data = analysis_per_place.number_of_answers(self.frame, metrics=self.get_place_metrics())
         if not data.empty:
             self.draw_map(data, directory+'number_of_answers.svg','Number of answers')
 
 
-    def response_time(self, directory=''):
+    def response_time(self, directory='', quantile=None):
         """Draws map of mean response time per country.
 
         :param directory: output directory -- default is '' (./maps/)
+        :param quantile: draw this quantile of all response times (e.g. 0.5 for median) instead of mean -- default is None
         """
 
         if not directory:
             directory = self.current_directory+'/maps/'
-        data = analysis_per_place.response_time(self.frame)
-        if not data.empty:
-            self.draw_map(data, directory+'response_time.svg','Response time')
+        if quantile is None:
+            data = analysis_per_place.response_time(self.frame, metrics=self.get_place_metrics())
+            if not data.empty:
+                self.draw_map(data, directory+'response_time.svg','Response time')
+        else:
+            data = analysis_per_place.response_time_quantile(self.frame, quantile, sketch=self.get_response_time_sketch())
+            if not data.empty:
+                self.draw_map(data, directory+'response_time_p%d.svg' % round(quantile*100),
+                              'Response time (%d. percentile)' % round(quantile*100))
         
 
 
@@ -239,7 +246,7 @@ class Map(Drawable):
 
         if not directory:
             directory = self.current_directory+'/maps/'
-        data = analysis_per_place.average_current_knowledge(self.frame,self.prior[0])
+        data = analysis_per_place.average_current_knowledge(self.get_first_questions(),self.prior[0],self.processes,self.get_knowledge_matrix())
         if not data.empty:
             self.draw_map(data, directory+'average_current_knowledge.svg','Average current knowledge ',colour_range="RdYlGn")
 
@@ -252,7 +259,7 @@ class Map(Drawable):
 
         if not directory:
             directory = self.current_directory+'/maps/'
-        data = analysis_per_place.success(self.frame)
+        data = analysis_per_place.success(self.frame, metrics=self.get_place_metrics())
         if not data.empty:
              self.draw_map(data, directory+'success.svg','Success rate',colour_range="RdYlGn")
 
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+from numpy import ndarray, generic, linspace, unique, int64
+from pandas import DataFrame, Series, MultiIndex
+from collections import OrderedDict, Mapping
+from copy import deepcopy
+from functools import wraps
+from inspect import getcallargs
+from hashlib import md5
+from os import path, makedirs, listdir, remove, rename, stat, utime
+import cPickle
+
+"""Opt-in memoization of analysis results. Results are keyed on cheap fingerprints of arguments (frames are identified
+by their index and a sample of their values) and on the namespace of the cache (md5 of the answer csv, so results of
+edited answers are never hit) and kept in an in-memory LRU and in a size-capped directory on disk.
+Memoization is off until enable() is called, decorated functions are then plain calls.
+"""
+
+
+SAMPLE = 1024 #number of sampled rows of every column in frame fingerprint
+
+_cache = None
+
+
+class Uncacheable(Exception):
+    pass
+
+
+def _update_array(digest, values):
+    if values.dtype == object:
+        digest.update(repr(values.tolist()))
+    else:
+        digest.update(str(values.dtype))
+        digest.update(values.tostring())
+
+
+def _update_index(digest, index):
+    if isinstance(index, MultiIndex):
+        for i in range(index.nlevels):
+            _update_array(digest, index.get_level_values(i).values)
+    else:
+        _update_array(digest, index.values)
+
+
+def fingerprint(value):
+    """Returns hex digest identifying value. Frames and series are identified by length, columns, whole index
+    and SAMPLE evenly spaced rows of every column -- their rows are answers identified by id and columns are
+    not rewritten in place. Raises Uncacheable for values without stable identity (lambdas, objects).
+    """
+
+    digest = md5()
+    if isinstance(value, (DataFrame, Series)):
+        digest.update(type(value).__name__+str(len(value)))
+        _update_index(digest, value.index)
+        rows = unique(linspace(0, len(value)-1, SAMPLE).astype(int64)) if len(value) else []
+        columns = value.iteritems() if isinstance(value, DataFrame) else [(value.name, value)]
+        for name, column in columns:
+            digest.update(repr(name))
+            _update_array(digest, column.values[rows])
+    elif isinstance(value, ndarray):
+        _update_array(digest, value)
+    elif hasattr(value, 'ids') and hasattr(value, 'scores') and hasattr(value, 'counts'): #PriorTable
+        for values in [value.ids, value.scores, value.counts]:
+            _update_array(digest, values)
+    elif isinstance(value, Mapping):
+        digest.update(repr(sorted((key, fingerprint(item)) for key, item in value.items())))
+    elif isinstance(value, (list, tuple)):
+        digest.update(repr([fingerprint(item) for item in value]))
+    elif callable(value):
+        if getattr(value, '__name__', '<lambda>') == '<lambda>':
+            raise Uncacheable()
+        digest.update(value.__module__+'.'+value.__name__)
+    elif value is None or isinstance(value, (bool, int, long, float, str, unicode, generic)):
+        digest.update(repr(value))
+    else:
+        raise Uncacheable()
+    return digest.hexdigest()
+
+
+class ResultCache():
+    def __init__(self, directory=None, size=64, disk_limit=2**30, namespace=''):
+        """Two-tier cache of results -- in-memory LRU and (optionally) pickles in directory with least recently used
+        files evicted when their total size exceeds disk_limit.
+
+        :param directory: directory of disk tier -- default is None (memory only)
+        :param size: number of results kept in memory
+        :param disk_limit: maximum size of disk tier in bytes
+        :param namespace: part of every key, identifies the whole dataset (see input_output.dataset_fingerprint) -- default is ''
+        """
+
+        self.directory = directory
+        self.namespace = namespace
+        self.size = size
+        self.disk_limit = disk_limit
+        self.memory = OrderedDict()
+        if directory is not None:
+            if not path.exists(directory):
+                makedirs(directory)
+            self.evict()
+
+
+    def _file(self, key):
+        return self.directory+'/'+key+'.pickle'
+
+
+    def get(self, key):
+        """Returns (True, result) if key is cached, otherwise (False, None).
+        """
+
+        if key in self.memory:
+            result = self.memory.pop(key)
+            self.memory[key] = result
+            return (True, deepcopy(result))
+        if self.directory is not None and path.exists(self._file(key)):
+            try:
+                with open(self._file(key), 'rb') as source:
+                    result = cPickle.load(source)
+            except (IOError, EOFError, cPickle.UnpicklingError):
+                return (False, None)
+            utime(self._file(key), None) #modification time of file is its LRU stamp
+            self._remember(key, result)
+            return (True, deepcopy(result))
+        return (False, None)
+
+
+    def _remember(self, key, result):
+        self.memory[key] = result
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+
+    def put(self, key, result):
+        result = deepcopy(result)
+        self._remember(key, result)
+        if self.directory is not None:
+            with open(self._file(key)+'.tmp', 'wb') as out:
+                cPickle.dump(result, out, 2)
+            rename(self._file(key)+'.tmp', self._file(key))
+            self.evict()
+
+
+    def evict(self):
+        """Removes least recently used files until the disk tier fits into disk_limit.
+        """
+
+        files = [self.directory+'/'+name for name in listdir(self.directory) if name.endswith('.pickle')]
+        files = sorted((stat(name).st_mtime, stat(name).st_size, name) for name in files)
+        total = sum(size for _, size, _ in files)
+        for _, size, name in files:
+            if total <= self.disk_limit:
+                break
+            remove(name)
+            total -= size
+
+
+    def clear(self):
+        self.memory.clear()
+        if self.directory is not None:
+            for name in listdir(self.directory):
+                if name.endswith('.pickle'):
+                    remove(self.directory+'/'+name)
+
+
+def enable(directory=None, size=64, disk_limit=2**30, namespace=''):
+    """Turns memoization of decorated functions on (see ResultCache for parameters).
+    """
+
+    global _cache
+    _cache = ResultCache(directory, size, disk_limit, namespace)
+    return _cache
+
+
+def disable():
+    global _cache
+    _cache = None
+
+
+def memoized(*ignore):
+    """Decorator of analysis functions. Result is looked up by name of the function and fingerprints of all
+    arguments (defaults included), calls with arguments which cannot be fingerprinted are not memoized.
+
+    :param ignore: names of arguments which do not change result (e.g. 'processes')
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _cache is None:
+                return func(*args, **kwargs)
+            try:
+                arguments = getcallargs(func, *args, **kwargs)
+                key = fingerprint([_cache.namespace, func.__module__+'.'+func.__name__]+
+                                  [(name, fingerprint(value)) for name, value in sorted(arguments.items()) if name not in ignore])
+            except Uncacheable:
+                return func(*args, **kwargs)
+            found, result = _cache.get(key)
+            if not found:
+                result = func(*args, **kwargs)
+                _cache.put(key, result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from elo_rating_system import estimate_prior_knowledge_batch, estimate_current_knowledge_batch, KnowledgeMatrix
+
+from multiprocessing import Pool, cpu_count
+from numpy import argsort, arange, searchsorted, unique, append
+from pandas import concat
+
+"""Process-parallel evaluation sharded by user. Frame and function are handed to workers once, when the pool is forked,
+so neither the answers nor the difficulties are pickled per task -- tasks are only shard numbers.
+"""
+
+
+_shared = {}
+
+
+def _initialize(frame, func, bounds):
+    _shared['frame'] = frame
+    _shared['func'] = func
+    _shared['bounds'] = bounds
+
+
+def _work(shard):
+    bounds = _shared['bounds']
+    return _shared['func'](_shared['frame'].iloc[bounds[shard]:bounds[shard+1]])
+
+
+def shard_bounds(users, shards):
+    """Returns row bounds of at most shards parts of frame sorted by user. Bounds are on user boundaries.
+
+    :param users: user column sorted by user
+    """
+
+    starts = unique(users, return_index=True)[1]
+    bounds = searchsorted(starts, arange(shards)*len(users)/float(shards))
+    return append(unique(starts[bounds[bounds < len(starts)]]), len(users))
+
+
+def map_users(frame, func, processes=None, shards=None):
+    """Runs func on parts of frame split by user in a process pool. Every user is whole in one part.
+
+    :param func: function DataFrame -> result, may be lambda (it is not pickled)
+    :param processes: number of processes -- default is None (number of cpus)
+    :param shards: number of parts -- default is None (4 parts per process)
+    :returns: list of results in order of users (one result of the whole frame when it is empty)
+    """
+
+    processes = processes or cpu_count()
+    frame = frame.iloc[argsort(frame.user.values, kind='mergesort')]
+    bounds = shard_bounds(frame.user.values, shards or 4*processes)
+    if len(bounds) < 2:
+        return [func(frame)]
+    if processes == 1:
+        return [func(frame.iloc[bounds[i]:bounds[i+1]]) for i in range(len(bounds)-1)]
+    pool = Pool(processes, _initialize, (frame, func, bounds))
+    try:
+        return pool.map(_work, range(len(bounds)-1), chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def estimate_prior_knowledge_parallel(frame, difficulties, by=['user'], processes=None):
+    """Parallel version of elo_rating_system.estimate_prior_knowledge_batch.
+
+    :param by: columns to group by, has to contain 'user' -- default is ['user']
+    """
+
+    if 'user' not in by:
+        raise ValueError('groups have to be split by user')
+    return concat(map_users(frame, lambda x: estimate_prior_knowledge_batch(x, difficulties, by), processes))
+
+
+def estimate_current_knowledge_parallel(frame, difficulties, processes=None):
+    """Parallel version of elo_rating_system.estimate_current_knowledge_batch (by user).
+    """
+
+    return KnowledgeMatrix.concat(map_users(frame, lambda x: estimate_current_knowledge_batch(x, difficulties), processes))
+
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from numpy import zeros, unique, searchsorted, bincount, ceil, log, clip, maximum, union1d, arange, int64, float64
+from pandas import Series, Index
+
+"""Mergeable quantile sketches of response times per place and correctness. Every (place, correct) cell is a histogram
+of logarithmic buckets with relative width 2*ACCURACY (as in DDSketch), so a quantile is within ACCURACY of the exact
+value, memory is fixed per place and sketches of chunks or of user shards are merged by addition.
+"""
+
+
+ACCURACY = 0.01
+GAMMA = (1+ACCURACY)/(1-ACCURACY)
+MAX_VALUE = 10**8 #milliseconds, larger response times fall into the last bucket
+BUCKETS = int(ceil(log(MAX_VALUE)/log(GAMMA)))+1 #bucket 0 holds values up to 1
+
+
+def bucket_values():
+    """Returns representative value of every bucket (values of bucket i are in (GAMMA**(i-1), GAMMA**i]).
+    """
+
+    values = 2*GAMMA**arange(BUCKETS)/(GAMMA+1)
+    values[0] = 1
+    return values
+
+
+class QuantileSketch():
+    def __init__(self, places=None, counts=None):
+        """Histograms of response times in logarithmic buckets. Use response_time_sketch or update to fill it.
+
+        :param places: sorted place IDs of rows
+        :param counts: numbers of answers, array of shape (places, 2, BUCKETS) -- second axis is wrong/correct
+        """
+
+        self.places = zeros(0, dtype=int64) if places is None else places
+        self.counts = zeros((0, 2, BUCKETS), dtype=int64) if counts is None else counts
+
+
+    def _extend(self, places):
+        """Adds rows for places.
+        """
+
+        merged = union1d(self.places, places)
+        if len(merged) > len(self.places):
+            counts = zeros((len(merged), 2, BUCKETS), dtype=int64)
+            counts[searchsorted(merged, self.places)] = self.counts
+            self.places, self.counts = merged, counts
+
+
+    def update(self, frame):
+        """Adds response times of answers of frame.
+        """
+
+        places = frame.place_asked.values.astype(int64)
+        self._extend(unique(places))
+        times = maximum(frame.response_time.values.astype(float64), 1)
+        buckets = clip(ceil(log(times)/log(GAMMA)), 0, BUCKETS-1).astype(int64)
+        correct = (frame.place_asked.values == frame.place_answered.values).astype(int64)
+        cells = (searchsorted(self.places, places)*2 + correct)*BUCKETS + buckets
+        self.counts += bincount(cells, minlength=self.counts.size).reshape(self.counts.shape)
+
+
+    def add(self, other, fill_value=0):
+        """Returns merged sketch (same signature as DataFrame.add, so sketches can be streaming aggregates).
+        """
+
+        result = QuantileSketch(self.places, self.counts.copy())
+        result._extend(other.places)
+        result.counts[searchsorted(result.places, other.places)] += other.counts
+        return result
+
+
+    def _histograms(self, right):
+        if right is None:
+            return self.counts.sum(axis=1)
+        return self.counts[:, 1 if right else 0]
+
+
+    def count(self, right=None):
+        """Returns number of answers per place.
+
+        :param right: filter only right/wrong/both answers
+        :type right: True/False/None -- default is None
+        """
+
+        return Series(self._histograms(right).sum(axis=1), index=Index(self.places))
+
+
+    def quantile(self, q=0.5, right=None):
+        """Returns q-quantile of response times per place (places without answers are left out).
+
+        :param q: quantile -- default is 0.5 (median)
+        :param right: filter only right/wrong/both answers
+        :type right: True/False/None -- default is None
+        """
+
+        histograms = self._histograms(right)
+        cumulative = histograms.cumsum(axis=1)
+        counts = cumulative[:, -1]
+        ranks = (q*(counts-1)).astype(int64)
+        buckets = (cumulative > ranks[:, None]).argmax(axis=1)
+        nonempty = counts > 0
+        result = Series(bucket_values()[buckets[nonempty]], index=Index(self.places[nonempty]))
+        result.name = 'response_time'
+        return result
+
+
+def response_time_sketch(frame):
+    """Returns QuantileSketch of response times of all answers of frame.
+    """
+
+    sketch = QuantileSketch()
+    sketch.update(frame)
+    return sketch
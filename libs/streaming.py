@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+from common import add_session_numbers_by_user
+from activity import build_activity_cube
+from pandas import concat
+import analysis_per_place
+import analysis_per_session
+import analysis_per_time
+import quantiles
+
+"""Streaming evaluation of analyses over answers that do not fit into memory.
+Chunks (see input_output.iter_answer_chunks) are fed into partial functions of analysis modules,
+partial results are merged (by addition unless the aggregate says otherwise) and turned into final result at the end.
+"""
+
+
+def _identity(partial):
+    return partial
+
+
+def _add(value, partial):
+    return value.add(partial, fill_value=0)
+
+
+class Aggregate():
+    def __init__(self, partial, result=_identity, sessions=False, merge=_add, **params):
+        """Mergeable aggregate of one analysis.
+
+        :param partial: function returning partial result (Series/DataFrame) of one chunk
+        :param result: function converting merged partial results into final result -- default is identity
+        :param sessions: whether partial function needs session_number column
+        :param merge: function merging two partial results -- default is addition
+        :param params: passed to partial function
+        """
+
+        self.partial = partial
+        self.finalize = result
+        self.sessions = sessions
+        self.merge = merge
+        self.params = params
+        self.value = None
+
+
+    def update(self, frame):
+        partial = self.partial(frame, **self.params)
+        self.value = partial if self.value is None else self.merge(self.value, partial)
+
+
+    def result(self):
+        return self.finalize(self.value)
+
+
+def place_metrics(threshold=60000):
+    return Aggregate(analysis_per_place.place_metrics, sessions=True, threshold=threshold)
+
+
+def number_of_answers(right=None):
+    return Aggregate(analysis_per_place.place_metrics, lambda metrics: analysis_per_place.number_of_answers(None, right, metrics=metrics))
+
+
+def response_time(right=None, threshold=60000):
+    return Aggregate(analysis_per_place.place_metrics, lambda metrics: analysis_per_place.response_time(None, right, threshold, metrics=metrics),
+                     threshold=threshold)
+
+
+def response_time_sketch():
+    return Aggregate(quantiles.response_time_sketch)
+
+
+def response_time_quantile(q=0.5, right=None):
+    return Aggregate(quantiles.response_time_sketch, lambda sketch: sketch.quantile(q, right))
+
+
+def success():
+    return Aggregate(analysis_per_place.place_metrics, lambda metrics: analysis_per_place.success(None, metrics=metrics), sessions=True)
+
+
+def sessions(sample=5, response_time_threshold=60000):
+    return Aggregate(analysis_per_session.session_table, sessions=True, merge=lambda value, partial: concat([value, partial]),
+                     sample=sample, response_time_threshold=response_time_threshold)
+
+
+def activity():
+    return Aggregate(build_activity_cube)
+
+
+def weekday_activity():
+    return Aggregate(analysis_per_time.weekday_activity)
+
+
+def hourly_activity():
+    return Aggregate(analysis_per_time.hourly_activity)
+
+
+def run(chunks, aggregates):
+    """Feeds all chunks into all aggregates in one pass and returns their results.
+
+    :param chunks: iterable of DataFrames -- every chunk has to hold whole history of its users
+    :param aggregates: dict of name -> Aggregate
+    :returns: dict of name -> result
+    """
+
+    sessions = any(aggregate.sessions for aggregate in aggregates.values())
+    for chunk in chunks:
+        if sessions and 'session_number' not in chunk:
+            chunk = add_session_numbers_by_user(chunk)
+        for aggregate in aggregates.values():
+            aggregate.update(chunk)
+    return dict((name, aggregate.result()) for name, aggregate in aggregates.items())
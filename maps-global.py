@@ -1,14 +1,27 @@
 # -*- coding: utf-8 -*-
 
 from libs.map import WorldMap
-from libs.input_output import get_arguments
+from libs.input_output import get_arguments, get_knowledge_matrix, dataset_fingerprint
+from libs.answer_store import AnswerStore
+from libs import streaming
 
 from os import path,makedirs
+from multiprocessing import cpu_count
 
 
 (items, frame, prior, codes, working_directory) = get_arguments(path.dirname(path.realpath(__file__)), False)
 
-m = WorldMap(working_directory, frame, prior=prior, codes=codes)
+stream = isinstance(frame, AnswerStore)
+if stream:
+    m = WorldMap(working_directory, frame.empty(), prior=prior, codes=codes)
+    results = streaming.run(frame.iter_chunks(), {'metrics': streaming.place_metrics(), 'sketch': streaming.response_time_sketch()})
+    m.set_place_metrics(results['metrics'])
+    m.set_response_time_sketch(results['sketch'])
+else:
+    m = WorldMap(working_directory, frame, prior=prior, codes=codes)
+    m.set_processes(cpu_count())
+    m.set_knowledge_matrix(get_knowledge_matrix(m.get_first_questions(), prior[0], working_directory+'/data',
+                                                dataset_fingerprint(working_directory+'/data/geography.answer.csv'), cpu_count()))
 
 directory = working_directory+'/maps/global/'
 if not path.exists(directory):
@@ -20,4 +33,9 @@ m.prior_knowledge(directory=directory)
 m.success(directory=directory)
 m.number_of_answers(directory=directory)
 m.response_time(directory=directory)
-m.average_current_knowledge(directory=directory)
\ No newline at end of file
+m.response_time(directory=directory, quantile=0.5)
+m.response_time(directory=directory, quantile=0.9)
+if stream:
+    print 'Skipping map of average current knowledge, it needs all answers in memory'
+else:
+    m.average_current_knowledge(directory=directory)
\ No newline at end of file
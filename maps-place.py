@@ -1,15 +1,18 @@
 # -*- coding: utf-8 -*-
 
 from libs.map import WorldMap
-from libs.input_output import get_arguments
+from libs.input_output import get_arguments, get_confusion_matrix, dataset_fingerprint
 
 from os import path,makedirs
 
 
-(items, frame, prior, codes, working_directory) = get_arguments(path.dirname(path.realpath(__file__)),True)
+(items, frame, prior, codes, working_directory) = get_arguments(path.dirname(path.realpath(__file__)),True, use_store=True)
+
+confusion = get_confusion_matrix(frame, working_directory+'/data', dataset_fingerprint(working_directory+'/data/geography.answer.csv'))
 
 for item in items:
     m = WorldMap(working_directory, frame, places=[int(item)],codes=codes, prior=prior)
+    m.set_confusion(confusion)
 
 
     directory = working_directory+'/maps/place/'+item+'/'